@@ -0,0 +1,3 @@
+"""
+Offline benchmarks for Nomina, run against a local OpenRouter stand-in.
+"""
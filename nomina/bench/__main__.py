@@ -0,0 +1,66 @@
+"""
+Run the offline benchmarks: python -m nomina.bench --output bench.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from .fake_openrouter import FakeOpenRouter, FakeOpenRouterConfig
+from . import scenarios
+
+SCENARIOS = ["chat", "chat_stream", "tool_loop", "server_chat", "file_tools", "payload"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Nomina offline benchmarks")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--iterations", "-n", type=int, default=50, help="Iterations per scenario")
+    parser.add_argument("--concurrency", "-c", type=int, default=8, help="Concurrent clients for server_chat")
+    parser.add_argument("--latency", type=float, default=0.02, help="Fake model latency in seconds")
+    parser.add_argument("--token-interval", type=float, default=0.0, help="Delay between streamed tokens")
+    parser.add_argument("--tree-dirs", type=int, default=50)
+    parser.add_argument("--tree-files", type=int, default=40, help="Files per directory")
+    parser.add_argument("--file-size", type=int, default=4096)
+    parser.add_argument("--payload-lengths", default="25,100,400", help="Conversation lengths (messages) for payload")
+    parser.add_argument("--output", "-o", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    selected = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    config = FakeOpenRouterConfig(latency=args.latency, token_interval=args.token_interval)
+    results = {"meta": {"python": platform.python_version(), "platform": platform.platform(),
+                        "started": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args)},
+               "scenarios": {}}
+    with FakeOpenRouter(config) as fake, scenarios.SyntheticTree(args.tree_dirs, args.tree_files, args.file_size) as tree:
+        for name in selected:
+            print(f"running {name}...", file=sys.stderr)
+            if name == "chat":
+                result = scenarios.bench_chat(fake, args.iterations)
+            elif name == "chat_stream":
+                result = scenarios.bench_chat(fake, args.iterations, stream=True)
+            elif name == "tool_loop":
+                result = scenarios.bench_tool_loop(fake, args.iterations, tree.root, tree.paths)
+            elif name == "server_chat":
+                result = scenarios.bench_server_chat(fake, args.iterations, args.concurrency, tree.root)
+            elif name == "payload":
+                lengths = [int(n) for n in args.payload_lengths.split(",") if n.strip()]
+                result = scenarios.bench_payload(args.iterations, lengths)
+            else:
+                result = scenarios.bench_file_tools(args.iterations, tree.root, tree.paths)
+            results["scenarios"][name] = result
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
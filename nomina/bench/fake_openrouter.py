@@ -0,0 +1,146 @@
+"""
+Local stand-in for the OpenRouter chat-completions and models endpoints, used by the
+benchmarks so they run offline with controlled, reproducible latency.
+
+Replies follow a script: the n-th assistant message after the last user message in a
+request gets step n, so concurrent conversations each walk the script independently.
+A step is either {"content": "..."} or {"tool_calls": [{"name": ..., "arguments": {...}}]}.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+DEFAULT_SCRIPT = [{"content": "Done. The requested change has been made and verified."}]
+
+
+class FakeOpenRouterConfig:
+    def __init__(self, script: Optional[List[dict]] = None, latency: float = 0.0, ttft: float = 0.0,
+                 token_interval: float = 0.0, model_count: int = 300, prompt_tokens_per_message: int = 50):
+        self.script = script or DEFAULT_SCRIPT
+        self.latency = latency  # before a non-streamed response / between stream start and first token
+        self.ttft = ttft
+        self.token_interval = token_interval
+        self.model_count = model_count
+        self.prompt_tokens_per_message = prompt_tokens_per_message
+
+
+class FakeOpenRouterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    config: FakeOpenRouterConfig = FakeOpenRouterConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, obj, status=200):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if not self.path.rstrip("/").endswith("/models"):
+            return self._send_json({"error": "not found"}, 404)
+        models = [{"id": f"fake/model-{i}", "name": f"Fake Model {i}", "context_length": 128000,
+                   "pricing": {"prompt": "0.000001", "completion": "0.000002"},
+                   "description": "Synthetic model entry " + "x" * 400} for i in range(self.config.model_count)]
+        self._send_json({"data": models})
+
+    def _step(self, messages) -> dict:
+        last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+        n = sum(1 for m in messages[last_user + 1:] if m.get("role") == "assistant")
+        script = self.config.script
+        return script[min(n, len(script) - 1)]
+
+    def _message(self, step, seed) -> dict:
+        if "tool_calls" in step:
+            calls = [{"id": f"call_{seed}_{i}", "type": "function",
+                      "function": {"name": c["name"], "arguments": json.dumps(c.get("arguments", {}))}}
+                     for i, c in enumerate(step["tool_calls"])]
+            return {"role": "assistant", "content": None, "tool_calls": calls}
+        return {"role": "assistant", "content": step.get("content", "")}
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        messages = request.get("messages", [])
+        step = self._step(messages)
+        message = self._message(step, len(messages))
+        usage = {"prompt_tokens": len(messages) * self.config.prompt_tokens_per_message,
+                 "completion_tokens": len((message.get("content") or "").split()) + 10}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if request.get("stream"):
+            return self._stream(request, message, usage)
+        time.sleep(self.config.latency)
+        self._send_json({"id": "gen-fake", "model": request.get("model"), "usage": usage,
+                         "choices": [{"index": 0, "message": message, "finish_reason": "stop"}]})
+
+    def _stream(self, request, message, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(obj):
+            data = (obj if isinstance(obj, str) else "data: " + json.dumps(obj)) + "\n\n"
+            data = data.encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        base = {"id": "gen-fake", "model": request.get("model")}
+        send(": OPENROUTER PROCESSING")
+        time.sleep(self.config.ttft or self.config.latency)
+        if message.get("tool_calls"):
+            for i, call in enumerate(message["tool_calls"]):
+                args = call["function"]["arguments"]
+                half = len(args) // 2
+                send(dict(base, choices=[{"index": 0, "delta": {"tool_calls": [
+                    {"index": i, "id": call["id"], "type": "function",
+                     "function": {"name": call["function"]["name"], "arguments": args[:half]}}]}}]))
+                send(dict(base, choices=[{"index": 0, "delta": {"tool_calls": [
+                    {"index": i, "function": {"arguments": args[half:]}}]}}]))
+        else:
+            for word in (message.get("content") or "").split(" "):
+                send(dict(base, choices=[{"index": 0, "delta": {"content": word + " "}}]))
+                if self.config.token_interval:
+                    time.sleep(self.config.token_interval)
+        send(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}], usage=usage))
+        send("data: [DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class FakeOpenRouter:
+    """Runs the stand-in server on a background thread: `with FakeOpenRouter(cfg) as fake:`
+    then point NominaLlm at `fake.api_base`."""
+    def __init__(self, config: Optional[FakeOpenRouterConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        handler = type("Handler", (FakeOpenRouterHandler,), {"config": config or FakeOpenRouterConfig()})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def config(self) -> FakeOpenRouterConfig:
+        return self.server.RequestHandlerClass.config
+
+    @property
+    def api_base(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,233 @@
+"""
+Benchmark scenarios. Each returns a dict of latency percentiles (seconds) and
+throughput so runs can be diffed as JSON.
+"""
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import requests
+
+from ..nominallm import ChatPayload, Message, NominaLlm, PayloadEncoder
+
+
+def summarize(samples: List[float], wall: float = None) -> Dict[str, float]:
+    ordered = sorted(samples)
+
+    def pct(p):
+        if not ordered:
+            return 0.0
+        k = (len(ordered) - 1) * p / 100
+        lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+        return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+    result = {"n": len(ordered), "mean": statistics.fmean(ordered) if ordered else 0.0,
+              "min": ordered[0] if ordered else 0.0, "p50": pct(50), "p90": pct(90), "p99": pct(99),
+              "max": ordered[-1] if ordered else 0.0}
+    if wall:
+        result["wall_seconds"] = wall
+        result["throughput_per_second"] = len(ordered) / wall
+    return result
+
+
+def timed(fn: Callable[[], object], iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def make_tree(root: str, dirs: int = 50, files_per_dir: int = 40, file_size: int = 4096, seed: int = 1234) -> List[str]:
+    """Create a deterministic synthetic source tree and return the relative file paths."""
+    rng = random.Random(seed)
+    words = ["def", "class", "return", "import", "self", "value", "result", "config", "error", "data"]
+    paths = []
+    for d in range(dirs):
+        rel_dir = os.path.join(f"pkg{d // 10}", f"mod{d}")
+        os.makedirs(os.path.join(root, rel_dir), exist_ok=True)
+        for f in range(files_per_dir):
+            rel = os.path.join(rel_dir, f"file{f}.py")
+            size, lines = 0, []
+            while size < file_size:
+                line = " ".join(rng.choice(words) for _ in range(8))
+                lines.append(line)
+                size += len(line) + 1
+            with open(os.path.join(root, rel), "w") as fh:
+                fh.write("\n".join(lines))
+            paths.append(rel)
+    return paths
+
+
+def _llm(fake, **kwargs) -> NominaLlm:
+    return NominaLlm(api_key="bench", api_base=fake.api_base, **kwargs)
+
+
+def _messages(llm):
+    return [llm.make_text_message("system", "You are a benchmark."), llm.make_text_message("user", "Go.")]
+
+
+def bench_chat(fake, iterations: int, stream: bool = False) -> Dict[str, float]:
+    """Single-turn chat without tools: request overhead (pooling, serialisation, parsing)."""
+    fake.config.script = [{"content": "Benchmark reply " + "word " * 50}]
+    llm = _llm(fake)
+    first_token = []
+
+    def run():
+        start = time.perf_counter()
+        seen = []
+
+        def on_token(_):
+            if not seen:
+                seen.append(True)
+                first_token.append(time.perf_counter() - start)
+        llm.chat(_messages(llm), on_token=on_token if stream else None)
+
+    start = time.perf_counter()
+    result = summarize(timed(run, iterations), time.perf_counter() - start)
+    if stream:
+        result["ttft"] = summarize(first_token)
+    llm.close()
+    return result
+
+
+def bench_tool_loop(fake, iterations: int, tree_root: str, paths: List[str]) -> Dict[str, float]:
+    """A scripted agent run: list a directory, read five files in one turn, write one
+    file, then answer - exercising the tool loop and concurrent tool execution."""
+    from .. import server
+    tools = server.make_tools(tree_root)
+    reads = [{"name": "read_file", "arguments": {"filepath": p}} for p in paths[:5]]
+    fake.config.script = [
+        {"tool_calls": [{"name": "list_files", "arguments": {"directory": os.path.dirname(paths[0])}}]},
+        {"tool_calls": reads},
+        {"tool_calls": [{"name": "write_file", "arguments": {"filepath": "bench_out/result.txt", "content": "ok\n" * 100}}]},
+        {"content": "All files processed."},
+    ]
+    llm = _llm(fake)
+    llm.add_tool(tools["read_file"], parallel=True)
+    llm.add_tool(tools["list_files"], parallel=True)
+    llm.add_tool(tools["write_file"])
+    start = time.perf_counter()
+    samples = timed(lambda: llm.chat(_messages(llm)), iterations)
+    result = summarize(samples, time.perf_counter() - start)
+    llm.close()
+    return result
+
+
+def bench_server_chat(fake, requests_total: int, concurrency: int, tree_root: str) -> Dict[str, float]:
+    """`/api/chat` of server.py under concurrent load, served by a threaded WSGI server;
+    each client thread drives its own session."""
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    from .. import server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    fake.config.script = [{"tool_calls": [{"name": "list_files", "arguments": {"directory": "."}}]},
+                          {"content": "Listed the directory."}]
+    server.llm_options = {"api_base": fake.api_base, "api_key": "bench"}
+    server.configure(tree_root, max_sessions=max(concurrency, 1))
+    httpd = make_server("127.0.0.1", 0, server.app, threaded=True, request_handler=QuietHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{httpd.server_port}/api/chat"
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    errors = []
+
+    def one(i):
+        start = time.perf_counter()
+        resp = session.post(url, json={"message": f"request {i}", "session_id": f"bench-{i % concurrency}"})
+        if resp.status_code != 200:
+            errors.append(resp.status_code)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, range(requests_total)))
+    result = summarize(samples, time.perf_counter() - start)
+    result["errors"] = len(errors)
+    result["concurrency"] = concurrency
+    httpd.shutdown()
+    session.close()
+    return result
+
+
+def bench_file_tools(iterations: int, tree_root: str, paths: List[str]) -> Dict[str, Dict[str, float]]:
+    """Raw cost of the file tools on a large synthetic tree."""
+    from .. import server
+    tools = server.make_tools(tree_root)
+    dirs = sorted({os.path.dirname(p) for p in paths})
+    rng = random.Random(42)
+    sample = [rng.choice(paths) for _ in range(iterations)]
+    reads = iter(sample)
+    listings = iter(dirs * (iterations // len(dirs) + 1))
+    return {
+        "read_file": summarize(timed(lambda: tools["read_file"](next(reads)), iterations)),
+        "list_files": summarize(timed(lambda: tools["list_files"](next(listings)), iterations)),
+        "list_tree": summarize(timed(lambda: tools["list_tree"](".", "10", None, "100000"), max(1, iterations // 10))),
+    }
+
+
+def _tool_round(i: int, rng: random.Random, output_size: int) -> list:
+    call = {"id": f"call_{i}", "type": "function",
+            "function": {"name": "read_file", "arguments": json.dumps({"filepath": f"pkg/mod{i}/file.py"})}}
+    output = "".join(rng.choice("abcdefgh \n") for _ in range(output_size))
+    return [{"role": "assistant", "content": None, "tool_calls": [call]},
+            Message(role="tool", content=output, tool_call_id=call["id"])]
+
+
+def bench_payload(iterations: int, lengths: List[int], tools: int = 12, output_size: int = 2000) -> Dict[str, Dict]:
+    """Per-round cost of serialising the request body against conversation length:
+    validating and dumping the whole ChatPayload each round (`full`) versus
+    `PayloadEncoder`, which only serialises the round just appended (`incremental`)."""
+    rng = random.Random(7)
+    schemas = [{"type": "function", "function": {"name": f"tool{t}", "description": "A benchmark tool. " * 10,
+                "parameters": {"type": "object", "properties": {"path": {"type": "string", "description": ""}},
+                               "required": ["path"]}}} for t in range(tools)]
+    tool_models = ChatPayload(model="m", messages=[], tools=schemas).tools
+    results = {}
+    for length in lengths:
+        conversation = [Message(role="system", content="You are a benchmark. " * 50), Message(role="user", content="Go.")]
+        while len(conversation) < length:
+            conversation += _tool_round(len(conversation), rng, output_size)
+        rounds = [_tool_round(length + i, rng, output_size) for i in range(iterations)]
+
+        def payload(messages):
+            return ChatPayload.model_construct(model="m", messages=messages, temperature=1.0, tools=tool_models,
+                                               tool_choice="auto")
+
+        full = iter(rounds)
+        encoder = PayloadEncoder()
+        encoder.encode(payload(conversation))  # the earlier rounds were sent already
+        incremental = iter(rounds)
+        results[str(length)] = {
+            "full": summarize(timed(lambda: json.dumps(ChatPayload(
+                model="m", messages=conversation + next(full), tools=tool_models, tool_choice="auto"
+            ).model_dump(exclude_none=True)).encode(), iterations)),
+            "incremental": summarize(timed(lambda: encoder.encode(payload(conversation + next(incremental))),
+                                           iterations)),
+        }
+    return results
+
+
+class SyntheticTree:
+    """Temporary synthetic tree used by the file-oriented scenarios."""
+    def __init__(self, dirs: int, files_per_dir: int, file_size: int, seed: int = 1234):
+        self.root = os.path.realpath(tempfile.mkdtemp(prefix="nomina-bench-"))
+        self.paths = make_tree(self.root, dirs, files_per_dir, file_size, seed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        shutil.rmtree(self.root, ignore_errors=True)
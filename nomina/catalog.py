@@ -0,0 +1,171 @@
+"""
+Cached model catalogue.
+
+The provider's /models list is a few hundred KB and rarely changes, so it is parsed once
+and kept in memory and under ~/.cache/nomina, shared by every client of the same API
+base. Once older than `ttl` it is revalidated with If-None-Match in a background thread
+while the old copy keeps being served; only a client with no copy at all waits for the
+network. Besides id and name, each model keeps its context length, completion limit and
+per-token pricing for callers that budget prompts or estimate cost.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from .search import cache_dir
+
+CATALOG_VERSION = 1
+
+
+def _price(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_models(data) -> List[Dict[str, Any]]:
+    """Models of a /models response: id, name, context_length, max_completion_tokens and
+    pricing (USD per token or request, by kind)."""
+    models = []
+    for m in data.get("data", []):
+        model_id = m.get("id")
+        if not model_id:
+            continue
+        top = m.get("top_provider") or {}
+        pricing = {kind: _price(v) for kind, v in (m.get("pricing") or {}).items()}
+        models.append({"id": model_id, "name": m.get("name") or model_id,
+                       "context_length": m.get("context_length") or top.get("context_length"),
+                       "max_completion_tokens": top.get("max_completion_tokens"),
+                       "pricing": {kind: v for kind, v in pricing.items() if v is not None}})
+    return models
+
+
+class ModelCatalog:
+    """The catalogue at `url`. Thread-safe; shared through `get_catalog`."""
+    retry_interval = 60.0  # seconds before a failed background refresh is tried again
+
+    def __init__(self, url: str, ttl: float = 3600.0, path: Optional[str] = "auto", timeout: float = 30.0):
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        if path == "auto":
+            path = os.path.join(cache_dir(), f"models-{hashlib.sha1(url.encode()).hexdigest()[:12]}.json")
+        self.path = path
+        self.models: List[Dict[str, Any]] = []
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.etag: Optional[str] = None
+        self.fetched_at = 0.0  # wall-clock time of the last fetch or revalidation
+        self.loaded = False
+        self._attempted_at = 0.0
+        self._refresher: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        self.loaded = True
+        if not self.path:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if state.get("version") != CATALOG_VERSION or state.get("url") != self.url:
+            return
+        self._set(state["models"], state.get("etag"), state.get("fetched_at", 0.0))
+
+    def _save(self):
+        if not self.path:
+            return
+        state = {"version": CATALOG_VERSION, "url": self.url, "etag": self.etag, "fetched_at": self.fetched_at,
+                 "models": self.models}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # the in-memory copy still works
+
+    def _set(self, models, etag, fetched_at):
+        self.models = models
+        self.by_id = {m["id"]: m for m in models}
+        self.etag = etag
+        self.fetched_at = fetched_at
+
+    @property
+    def stale(self) -> bool:
+        return time.time() - self.fetched_at > self.ttl
+
+    def request_headers(self, headers: Dict[str, str]) -> Dict[str, str]:
+        """`headers` plus If-None-Match when there is a copy to revalidate."""
+        with self._lock:
+            if not self.loaded:
+                self._load()
+            if self.models and self.etag:
+                return dict(headers, **{"If-None-Match": self.etag})
+        return dict(headers)
+
+    def update(self, status: int, etag: Optional[str], data) -> List[Dict[str, Any]]:
+        """Store the outcome of a successful request (`data` is ignored for a 304)."""
+        with self._lock:
+            if status == 304 and self.models:
+                self.fetched_at = time.time()
+            else:
+                self._set(parse_models(data), etag, time.time())
+            self._save()
+            return self.models
+
+    def refresh(self, headers: Dict[str, str], session=None) -> List[Dict[str, Any]]:
+        """Fetch or revalidate the catalogue now."""
+        resp = (session or requests).get(self.url, headers=self.request_headers(headers), timeout=self.timeout)
+        resp.raise_for_status()
+        return self.update(resp.status_code, resp.headers.get("ETag"),
+                           None if resp.status_code == 304 else resp.json())
+
+    def _refresh_quietly(self, headers):
+        try:
+            self.refresh(headers)
+        except (requests.RequestException, ValueError):
+            pass  # keep serving the old copy
+
+    def cached(self, headers: Dict[str, str]) -> Optional[List[dict]]:
+        """The models without waiting on the network, or None if there is no copy yet. A
+        stale copy is returned as is and refreshed in the background."""
+        with self._lock:
+            if not self.loaded:
+                self._load()
+            now = time.time()
+            if (self.models and now - self.fetched_at > self.ttl and now - self._attempted_at > self.retry_interval
+                    and not (self._refresher and self._refresher.is_alive())):
+                self._attempted_at = now
+                self._refresher = threading.Thread(target=self._refresh_quietly, args=(headers,), daemon=True,
+                                                   name="nomina-models")
+                self._refresher.start()
+            return self.models or None
+
+    def get(self, model_id: str) -> Optional[Dict[str, Any]]:
+        """A model's entry from the copy at hand (never fetches)."""
+        with self._lock:
+            if not self.loaded:
+                self._load()
+            return self.by_id.get(model_id)
+
+
+_catalogs: Dict[str, ModelCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(url: str) -> ModelCatalog:
+    """The shared catalogue for the models endpoint `url`."""
+    with _catalogs_lock:
+        catalog = _catalogs.get(url)
+        if catalog is None:
+            catalog = _catalogs[url] = ModelCatalog(url)
+        return catalog
@@ -0,0 +1,176 @@
+"""
+History compaction for NominaLlm: keeps the conversation sent to the model under a
+token budget without touching the caller's own history list.
+"""
+import json
+import hashlib
+from typing import Callable, Optional, Tuple
+from pydantic import BaseModel
+
+
+def as_message(msg):
+    """Coerce a raw response dict into a `Message` (pass-through for Messages)."""
+    from .nominallm import Message
+    return msg if isinstance(msg, BaseModel) else Message.model_validate(msg)
+
+
+def message_text(msg) -> str:
+    content = msg.content
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    return "".join(part.text or "" for part in content)
+
+
+def estimate_tokens(msg) -> int:
+    """Rough token count (~4 characters per token plus per-message overhead); good
+    enough for budgeting without pulling in a tokenizer."""
+    msg = as_message(msg)
+    chars = len(message_text(msg))
+    for call in msg.tool_calls or []:
+        chars += len(call.function.name) + len(call.function.arguments)
+    return chars // 4 + 4
+
+
+def elide(text: str, limit: int, head_ratio: float = 0.7) -> str:
+    """Keep the head and tail of `text` within `limit` characters, the omission marker
+    included, so eliding the result again leaves it as it is."""
+    if len(text) <= limit:
+        return text
+    keep = limit - len(f"\n[... {len(text)} characters omitted ...]\n")  # the count has no more digits than that
+    if keep <= 0:
+        return text[:limit]
+    head = int(keep * head_ratio)
+    tail = keep - head
+    omitted = len(text) - head - tail
+    return f"{text[:head]}\n[... {omitted} characters omitted ...]\n{text[len(text) - tail:]}"
+
+
+class CompactionReport(BaseModel):
+    before: int
+    after: int
+    truncated: int = 0
+    collapsed: int = 0
+    summarized: int = 0
+
+    @property
+    def saved(self) -> int:
+        return self.before - self.after
+
+
+class HistoryCompactor:
+    """Shrinks a conversation to `token_budget` in increasingly lossy stages, stopping
+    as soon as it fits:
+
+    1. truncate tool outputs longer than `max_tool_output` characters,
+    2. collapse old assistant tool_calls + tool results into a one-line note,
+    3. replace older turns with a summary, if a `summarizer` is given.
+
+    System messages and the last `keep_recent` messages are never altered, and the
+    recent window is widened as needed so it never starts inside a tool-call group.
+    """
+    def __init__(self, token_budget: int = 100_000, max_tool_output: int = 4_000, keep_recent: int = 8,
+                 summarizer: Optional[Callable[[list], str]] = None):
+        self.token_budget = token_budget
+        self.max_tool_output = max_tool_output
+        self.keep_recent = keep_recent
+        self.summarizer = summarizer
+        self._summary_cache: Tuple[str, str] = ("", "")
+
+    def _recent_start(self, messages) -> int:
+        start = max(0, len(messages) - self.keep_recent)
+        while start > 0 and messages[start].role == "tool":
+            start -= 1
+        return start
+
+    def compact(self, messages: list) -> Tuple[list, CompactionReport]:
+        messages = [as_message(m) for m in messages]
+        before = sum(estimate_tokens(m) for m in messages)
+        report = CompactionReport(before=before, after=before)
+        if before <= self.token_budget:
+            return messages, report
+
+        total = before
+        for stage in (self._truncate_tool_outputs, self._collapse_tool_turns, self._summarize):
+            messages, total = stage(messages, total, report)
+            if total <= self.token_budget:
+                break
+        report.after = total
+        return messages, report
+
+    def _truncate_tool_outputs(self, messages, total, report):
+        recent = self._recent_start(messages)
+        out = []
+        for i, msg in enumerate(messages):
+            if i < recent and msg.role == "tool" and len(message_text(msg)) > self.max_tool_output:
+                old = estimate_tokens(msg)
+                msg = msg.model_copy(update={"content": elide(message_text(msg), self.max_tool_output)})
+                total -= old - estimate_tokens(msg)
+                report.truncated += 1
+            out.append(msg)
+        return out, total
+
+    def _collapse_tool_turns(self, messages, total, report):
+        from .nominallm import Message
+        recent = self._recent_start(messages)
+        out, i = [], 0
+        while i < len(messages):
+            msg = messages[i]
+            if i >= recent or msg.role != "assistant" or not msg.tool_calls or total <= self.token_budget:
+                out.append(msg)
+                i += 1
+                continue
+            j = i + 1
+            results = {}
+            while j < len(messages) and messages[j].role == "tool":
+                results[messages[j].tool_call_id] = message_text(messages[j])
+                j += 1
+            notes = []
+            for call in msg.tool_calls:
+                args = call.function.arguments
+                args = args if len(args) <= 120 else args[:117] + "..."
+                result = results.get(call.id, "")
+                notes.append(f"{call.function.name}({args}) -> {len(result)} chars")
+            text = message_text(msg)
+            note = Message(role="assistant", content=(text + "\n" if text else "") + "[Earlier tool calls: " + "; ".join(notes) + "]")
+            total -= sum(estimate_tokens(m) for m in messages[i:j]) - estimate_tokens(note)
+            report.collapsed += j - i
+            out.append(note)
+            i = j
+        return out, total
+
+    def _summarize(self, messages, total, report):
+        from .nominallm import Message
+        if self.summarizer is None:
+            return messages, total
+        recent = self._recent_start(messages)
+        older = [m for m in messages[:recent] if m.role != "system"]
+        if not older:
+            return messages, total
+        key = hashlib.sha1(json.dumps([m.model_dump(exclude_none=True) for m in older]).encode()).hexdigest()
+        if self._summary_cache[0] != key:
+            self._summary_cache = (key, self.summarizer(older))
+        summary = Message(role="user", content=f"[Summary of the earlier conversation]\n{self._summary_cache[1]}")
+        systems = [m for m in messages[:recent] if m.role == "system"]
+        total -= sum(estimate_tokens(m) for m in older) - estimate_tokens(summary)
+        report.summarized += len(older)
+        return systems + [summary] + messages[recent:], total
+
+
+def make_summarizer(llm, model: Optional[str] = None, max_chars: int = 60_000) -> Callable[[list], str]:
+    """Summarizer for `HistoryCompactor` that asks a (sync) NominaLlm, without tools -
+    its `fast_model` unless `model` is given."""
+    from .nominallm import ChatPayload, Message
+
+    def summarize(messages) -> str:
+        transcript = "\n\n".join(f"{m.role}: {message_text(m)}" for m in messages)
+        prompt = [
+            Message(role="system", content="Summarise this conversation between a user and a coding agent. "
+                                           "Keep file names, decisions, open tasks and errors. Be terse."),
+            Message(role="user", content=elide(transcript, max_chars)),
+        ]
+        response = llm._complete(ChatPayload(model=model or llm.fast_model or llm.default_model, messages=prompt))
+        return response["choices"][0]["message"].get("content") or ""
+
+    return summarize
@@ -0,0 +1,185 @@
+"""
+Targeted file edits for the apply_edit tools: SEARCH/REPLACE blocks or a unified diff,
+validated against the current file and written atomically.
+
+All changes of one call are located in the original text (so they may come in any order
+but must not overlap), widened to whole lines, and applied together; if any anchor is
+missing or ambiguous nothing is written.
+"""
+import os
+import re
+import tempfile
+from typing import List, Tuple
+
+from pydantic import BaseModel, Field
+
+_BLOCK = re.compile(r"^<{5,9} SEARCH[^\n]*\n(.*?)^={5,9}[ \t]*\r?\n(.*?)^>{5,9} REPLACE[^\n]*$", re.M | re.S)
+_HUNK = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@", re.M)
+_UMASK = os.umask(0o022)  # read once (os.umask can only be read by setting it) ...
+os.umask(_UMASK)  # ... and put back; new files get 0o666 & ~umask like open() gives them
+
+
+class EditError(ValueError):
+    pass
+
+
+class Hunk(BaseModel):
+    old_start: int  # 1-based line in the original file
+    old_lines: int
+    new_start: int  # 1-based line in the edited file
+    new_lines: int
+    text: str = Field(exclude=True, repr=False)  # replacement for the original lines
+
+
+class EditResult(BaseModel):
+    path: str
+    hunks: List[Hunk]
+    lines: int
+    old_text: str = Field(exclude=True, repr=False)
+    new_text: str = Field(exclude=True, repr=False)
+
+    def render(self) -> str:
+        ranges = ", ".join((f"lines {h.new_start}-{h.new_start + h.new_lines - 1}" if h.new_lines else
+                            f"at line {h.new_start}") + f" (-{h.old_lines} +{h.new_lines})" for h in self.hunks)
+        return f"Applied {len(self.hunks)} edit(s) to {self.path}: {ranges}; file now has {self.lines} lines."
+
+
+def _line_span(text: str, start: int, end: int) -> Tuple[int, int]:
+    """Widen [start, end) to whole lines."""
+    line_start = text.rfind("\n", 0, start) + 1
+    if end > start and text[end - 1] == "\n":
+        return line_start, end
+    line_end = text.find("\n", end)
+    return line_start, len(text) if line_end < 0 else line_end + 1
+
+
+def _search_replace(text: str, edit: str) -> List[Tuple[int, int, str]]:
+    blocks = _BLOCK.findall(edit)
+    if not blocks:
+        raise EditError("No SEARCH/REPLACE blocks found")
+    changes = []
+    for i, (search, replace) in enumerate(blocks, 1):
+        if not search:
+            if text:
+                raise EditError(f"Block {i}: empty SEARCH is only allowed for a new or empty file")
+            changes.append((0, 0, replace))
+            continue
+        pos = text.find(search)
+        if pos < 0:
+            stripped = search.strip()
+            hint = " (it matches if leading/trailing whitespace is ignored)" if stripped and stripped in text else ""
+            raise EditError(f"Block {i}: SEARCH text not found{hint}; it must match the file exactly")
+        if text.find(search, pos + 1) >= 0:
+            raise EditError(f"Block {i}: SEARCH text occurs more than once; add surrounding lines to make it unique")
+        start, end = _line_span(text, pos, pos + len(search))
+        changes.append((start, end, text[start:pos] + replace + text[pos + len(search):end]))
+    return changes
+
+
+def _unified_diff(text: str, edit: str) -> List[Tuple[int, int, str]]:
+    lines = text.splitlines(keepends=True)
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    hunks, current = [], None
+    for raw in edit.splitlines():
+        match = _HUNK.match(raw)
+        if match:
+            current = (int(match.group(1)), [], [])
+            hunks.append(current)
+        elif current is None:
+            continue  # "---"/"+++" headers and anything else before the first hunk
+        elif raw.startswith("\\"):
+            continue  # "\ No newline at end of file"
+        elif raw[:1] in ("-", " ") or raw == "":
+            current[1].append(raw[1:])
+            if raw[:1] != "-":
+                current[2].append(raw[1:])
+        elif raw[:1] == "+":
+            current[2].append(raw[1:])
+    if not hunks:
+        raise EditError("No @@ hunks found in the diff")
+    stripped = [line.rstrip("\r\n") for line in lines]
+    changes = []
+    for i, (hint, old, new) in enumerate(hunks, 1):
+        n = len(old)
+        if not n and hint > len(lines):
+            raise EditError(f"Hunk {i} (@@ -{hint},0) inserts after line {hint} but the file has {len(lines)} lines")
+        # a pure insertion `@@ -L,0` goes after line L, i.e. at 0-based index L
+        candidates = [k for k in range(len(lines) - n + 1) if stripped[k:k + n] == old] if n else [hint]
+        if not candidates:
+            raise EditError(f"Hunk {i} (@@ -{hint}): context and removed lines do not match the file")
+        k = min(candidates, key=lambda c: abs(c - (hint - 1)))  # nearest to the stated line
+        eol = "\r\n" if lines and lines[0].endswith("\r\n") else "\n"
+        body = "".join(line + eol for line in new)
+        if not n and k == len(lines) and lines and not lines[-1].endswith("\n"):
+            body = eol + body[:-len(eol)]  # after an unterminated last line
+        end_line = min(k + n, len(lines))
+        if n and end_line == len(lines) and lines and not lines[-1].endswith("\n"):
+            body = body[:-len(eol)] if body else body  # keep a missing final newline missing
+        changes.append((offsets[min(k, len(lines))], offsets[end_line], body))
+    return changes
+
+
+def plan_edit(text: str, edit: str) -> Tuple[str, List[Hunk]]:
+    """Apply `edit` to `text` in memory; returns the new text and the line-level hunks."""
+    if "\r\n" in text:
+        edit = edit.replace("\r\n", "\n").replace("\n", "\r\n")
+    if _BLOCK.search(edit):
+        changes = _search_replace(text, edit)
+    elif _HUNK.search(edit):
+        changes = _unified_diff(text, edit)
+    else:
+        raise EditError("Expected SEARCH/REPLACE blocks (<<<<<<< SEARCH / ======= / >>>>>>> REPLACE) "
+                        "or a unified diff with @@ hunks")
+    changes.sort()
+    for (s1, e1, _), (s2, e2, _) in zip(changes, changes[1:]):
+        if s2 < e1:
+            raise EditError("Edits overlap; merge them into one block")
+    parts, hunks, pos, delta = [], [], 0, 0
+    for start, end, replacement in changes:
+        parts += [text[pos:start], replacement]
+        old_start = text.count("\n", 0, start) + 1
+        old_lines = text.count("\n", start, end) + (1 if end > start and not text.endswith("\n", start, end) else 0)
+        new_lines = replacement.count("\n") + (1 if replacement and not replacement.endswith("\n") else 0)
+        hunks.append(Hunk(old_start=old_start, old_lines=old_lines, new_start=old_start + delta,
+                          new_lines=new_lines, text=replacement))
+        delta += new_lines - old_lines
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts), hunks
+
+
+def write_atomic(full_path: str, content: str):
+    """Write via a temporary file in the same directory and rename over the target."""
+    directory = os.path.dirname(full_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".nomina-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+        if os.path.exists(full_path):
+            os.chmod(tmp, os.stat(full_path).st_mode & 0o7777)
+        else:
+            os.chmod(tmp, 0o666 & ~_UMASK)  # mkstemp creates it 0600
+        os.replace(tmp, full_path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def apply_edit(full_path: str, edit: str, path: str = None) -> EditResult:
+    """Apply `edit` to the file at `full_path` (created if the edit is a single empty-SEARCH block)."""
+    path = path or full_path
+    try:
+        with open(full_path, encoding="utf-8", newline="") as f:
+            text = f.read()
+    except FileNotFoundError:
+        text = ""
+    new_text, hunks = plan_edit(text, edit)
+    write_atomic(full_path, new_text)
+    lines = new_text.count("\n") + (1 if new_text and not new_text.endswith("\n") else 0)
+    return EditResult(path=path, hunks=hunks, lines=lines, old_text=text, new_text=new_text)
@@ -0,0 +1,99 @@
+"""
+LRU cache of file contents with a byte budget. Entries are validated against the file's
+(mtime, size, inode) on every lookup, so edits made outside the tools (shell commands,
+editors) are picked up; the tools also invalidate paths they write or delete.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from .metrics import Metrics
+
+DEFAULT_BUDGET = 64 * 1024 * 1024
+DEFAULT_MAX_FILE_SIZE = 4 * 1024 * 1024
+
+
+class FileCache:
+    def __init__(self, max_bytes: int = DEFAULT_BUDGET, max_file_size: int = DEFAULT_MAX_FILE_SIZE,
+                 metrics: Optional[Metrics] = None):
+        self.max_bytes = max_bytes
+        self.max_file_size = min(max_file_size, max_bytes)
+        self.metrics = metrics
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int, int], bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    @staticmethod
+    def _key(st: os.stat_result) -> Tuple[int, int, int]:
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _count(self, result: str):
+        if self.metrics is not None:
+            self.metrics.inc("nomina_file_cache_requests_total", result=result)
+
+    def _publish(self):
+        if self.metrics is not None:
+            self.metrics.set("nomina_file_cache_bytes", self.bytes)
+            self.metrics.set("nomina_file_cache_entries", len(self._entries))
+
+    def _drop(self, path: str):
+        _, data = self._entries.pop(path)
+        self.bytes -= len(data)
+
+    def get(self, path: str) -> Optional[bytes]:
+        """Contents of `path`, from the cache when it is still current. None for files
+        larger than `max_file_size`, which the caller should read (or mmap) itself."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        if st.st_size > self.max_file_size:
+            return None
+        key = self._key(st)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                self._count("hit")
+                return entry[1]
+            self.misses += 1
+            self._count("miss")
+        with open(path, "rb") as f:
+            key = self._key(os.fstat(f.fileno()))
+            data = f.read()
+        if len(data) != key[1]:
+            return data  # changed while reading; don't cache a torn read
+        with self._lock:
+            if path in self._entries:
+                self._drop(path)
+            self._entries[path] = (key, data)
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+                if self.metrics is not None:
+                    self.metrics.inc("nomina_file_cache_evictions_total")
+            self._publish()
+        return data
+
+    def invalidate(self, path: str):
+        path = os.path.abspath(path)
+        with self._lock:
+            if path in self._entries:
+                self._drop(path)
+                self.invalidations += 1
+                self._publish()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            self._publish()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {"entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / requests if requests else 0.0,
+                    "evictions": self.evictions, "invalidations": self.invalidations}
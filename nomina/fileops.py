@@ -0,0 +1,440 @@
+"""
+File access shared by the TUI tools and the API server.
+
+Ranged, size-capped reads: small files are read in one go; files above MMAP_THRESHOLD are
+memory-mapped so a page from the middle of a large log only touches the pages it needs.
+
+Recursive listings: one os.scandir pass per directory (no extra stat for the type),
+depth and entry caps, and .gitignore rules so a project can be mapped in one tool call.
+
+Batches: many reads or writes in one tool call, run on a small thread pool, with a
+per-file status so one bad path doesn't fail the rest.
+"""
+import json
+import mmap
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from .edits import write_atomic
+
+DEFAULT_MAX_BYTES = 100_000
+MMAP_THRESHOLD = 1 << 20
+_COUNT_BLOCK = 1 << 22
+
+
+class FileChunk(BaseModel):
+    path: str
+    content: str
+    size: int
+    start: int  # byte offsets [start, end)
+    end: int
+    start_line: int
+    end_line: int
+    continuation: Optional[str] = None  # pass back to read the next chunk
+
+    @property
+    def complete(self) -> bool:
+        return self.start == 0 and self.end == self.size
+
+    def render(self) -> str:
+        """Content for the model, with a footer describing the range when it is partial."""
+        if self.complete:
+            return self.content
+        footer = (f"[{self.path}: lines {self.start_line}-{self.end_line}, "
+                  f"bytes {self.start}-{self.end} of {self.size}")
+        if self.continuation:
+            footer += f"; more follows, call read_file with continuation=\"{self.continuation}\""
+        separator = "" if self.content.endswith("\n") else "\n"
+        return f"{self.content}{separator}{footer}]"
+
+
+def _parse_range(value: str, name: str) -> Tuple[int, Optional[int]]:
+    """'a-b', 'a-' or 'a' -> (a, b|None)."""
+    text = str(value).strip()
+    try:
+        if "-" in text:
+            first, last = text.split("-", 1)
+            return int(first), int(last) if last.strip() else None
+        return int(text), int(text)
+    except ValueError:
+        raise ValueError(f"Invalid {name} {value!r}, expected 'start-end'")
+
+
+def _count_newlines(buf, end: int) -> int:
+    if isinstance(buf, bytes):
+        return buf.count(b"\n", 0, end)
+    return sum(buf[i:min(i + _COUNT_BLOCK, end)].count(b"\n") for i in range(0, end, _COUNT_BLOCK))
+
+
+def _skip_lines(buf, pos: int, count: int, size: int) -> int:
+    """Byte offset just past `count` lines starting at `pos` (size if the file ends first).
+    Whole blocks are skipped by counting their newlines, so deep seeks stay in C."""
+    while count > 64:
+        block = buf[pos:pos + _COUNT_BLOCK]
+        newlines = block.count(b"\n")
+        if newlines >= count:
+            break
+        if len(block) < _COUNT_BLOCK:
+            return size
+        count -= newlines
+        pos += len(block)
+    for _ in range(count):
+        pos = buf.find(b"\n", pos)
+        if pos < 0:
+            return size
+        pos += 1
+    return pos
+
+
+def _read(buf, path, size, lines, byte_range, continuation, max_bytes) -> FileChunk:
+    start_line = None
+    if continuation:
+        try:
+            offset, line = continuation.split(":")
+            start, end, start_line = int(offset), None, int(line)
+        except ValueError:
+            raise ValueError(f"Invalid continuation token {continuation!r}")
+    elif lines:
+        first, last = _parse_range(lines, "line range")
+        start_line = max(first, 1)
+        start = _skip_lines(buf, 0, start_line - 1, size)
+        end = None if last is None else _skip_lines(buf, start, max(last - start_line + 1, 0), size)
+    elif byte_range:
+        start, end = _parse_range(byte_range, "byte range")
+    else:
+        start, end = 0, None
+
+    start = min(max(start, 0), size)
+    end = size if end is None else min(max(end, start), size)
+    capped = end - start > max_bytes
+    if capped:
+        end = start + max_bytes
+        cut = buf.rfind(b"\n", start, end)
+        if cut >= start:
+            end = cut + 1  # stop on a line boundary when there is one
+    data = buf[start:end]
+    if start_line is None:
+        start_line = _count_newlines(buf, start) + 1
+    newlines = data.count(b"\n")
+    end_line = start_line + max(newlines - (1 if data.endswith(b"\n") else 0), 0)
+    next_line = start_line + newlines
+    return FileChunk(path=path, content=data.decode("utf-8", errors="replace"), size=size, start=start, end=end,
+                     start_line=start_line, end_line=end_line,
+                     continuation=f"{end}:{next_line}" if capped and end < size else None)
+
+
+def read_chunk(full_path: str, path: str = None, lines: Optional[str] = None, byte_range: Optional[str] = None,
+               continuation: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES, cache=None) -> FileChunk:
+    """Read part of a file. `lines` ('120-200', 1-based inclusive) or `byte_range`
+    ('0-4096', end exclusive) select a range, `continuation` resumes a capped read. At
+    most `max_bytes` are returned; a capped chunk carries the continuation for the rest.
+    With a `cache` (FileCache), files it accepts are served from memory."""
+    path = path or full_path
+    if cache is not None:
+        data = cache.get(full_path)
+        if data is not None:
+            return _read(data, path, len(data), lines, byte_range, continuation, max_bytes)
+    with open(full_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MMAP_THRESHOLD:
+            return _read(f.read(), path, size, lines, byte_range, continuation, max_bytes)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return _read(buf, path, size, lines, byte_range, continuation, max_bytes)
+
+
+DEFAULT_IGNORES = {".git", "node_modules", "__pycache__", ".venv", "venv", ".tox", ".mypy_cache", ".pytest_cache"}
+DEFAULT_MAX_ENTRIES = 1000
+
+
+def glob_regex(pattern: str) -> str:
+    """Translate a gitignore-style glob ('*', '?', '**', '[...]') into a regex."""
+    out, i = [], 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            out.append("[" + pattern[i + 1:end].replace("!", "^", 1) + "]")
+            i = end + 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+
+def glob_matcher(pattern: str) -> Callable[[str], bool]:
+    """Match relative paths against `pattern`; patterns without a '/' match the file name."""
+    regex = re.compile(glob_regex(pattern) + r"\Z")
+    if "/" in pattern:
+        return lambda path: regex.match(path) is not None
+    return lambda path: regex.match(path.rsplit("/", 1)[-1]) is not None
+
+
+class IgnoreRules:
+    """The .gitignore rules in effect for a directory: its parents' rules plus its own.
+    Supports comments, negation, directory-only and anchored patterns and '**'."""
+    def __init__(self, rules=()):
+        self.rules = tuple(rules)  # (base dir, regex, negated, directory only)
+
+    def child(self, full_dir: str, rel_dir: str) -> "IgnoreRules":
+        try:
+            with open(os.path.join(full_dir, ".gitignore"), errors="replace") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return self
+        rules = list(self.rules)
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            line = line.lstrip("!")
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            anchored = "/" in line  # a leading or inner slash anchors to this directory
+            regex = glob_regex(line.lstrip("/"))
+            rules.append((rel_dir, re.compile(("" if anchored else "(?:.*/)?") + regex + r"\Z"), negated, dir_only))
+        return IgnoreRules(rules)
+
+    def ignored(self, rel_path: str, is_dir: bool) -> bool:
+        result = False
+        for base, regex, negated, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not rel_path.startswith(base + "/"):
+                    continue
+                path = rel_path[len(base) + 1:]
+            else:
+                path = rel_path
+            if regex.match(path):
+                result = not negated
+        return result
+
+
+class TreeEntry(BaseModel):
+    path: str  # relative to the listed directory; directories end with '/'
+    size: int
+    mtime: float
+
+
+class TreeListing(BaseModel):
+    directory: str
+    depth: int
+    entries: List[TreeEntry]
+    truncated: bool = False
+
+    def render(self) -> str:
+        lines = [f"{e.path}\t{_human_size(e.size) if not e.path.endswith('/') else '-'}\t"
+                 f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(e.mtime))}" for e in self.entries]
+        header = f"{len(self.entries)} entries under {self.directory}/ (depth {self.depth}; path, size, modified):"
+        if self.truncated:
+            lines.append(f"[truncated at {len(self.entries)} entries; narrow it with directory, pattern or depth]")
+        return "\n".join([header] + lines)
+
+
+def _human_size(size: int) -> str:
+    for unit in ("B", "K", "M", "G"):
+        if size < 1024 or unit == "G":
+            return f"{size}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+
+
+def list_tree(full_dir: str, directory: str = ".", depth: int = 3, pattern: Optional[str] = None,
+              max_entries: int = DEFAULT_MAX_ENTRIES, root: Optional[str] = None) -> TreeListing:
+    """Walk `full_dir` breadth first with os.scandir, up to `depth` levels, skipping
+    DEFAULT_IGNORES and paths matched by .gitignore files (from `root` down). `pattern`
+    ('*.py', 'src/**/test_*.py') keeps only matching files. Stops after `max_entries`."""
+    match = glob_matcher(pattern) if pattern else None
+    # walk with paths relative to `root` so .gitignore files above the listed directory apply
+    root = root or full_dir
+    base = os.path.relpath(full_dir, root).replace(os.sep, "/")
+    base = "" if base == "." else base
+    rules, ancestor, ancestor_rel = IgnoreRules(), root, ""
+    for part in base.split("/")[:-1] if base else []:
+        rules = rules.child(ancestor, ancestor_rel)
+        ancestor, ancestor_rel = os.path.join(ancestor, part), f"{ancestor_rel}/{part}".lstrip("/")
+    if base:
+        rules = rules.child(ancestor, ancestor_rel)
+
+    entries, truncated = [], False
+    queue = deque([(full_dir, base, 1, rules)])
+    while queue and not truncated:
+        path, rel_dir, level, rules = queue.popleft()
+        rules = rules.child(path, rel_dir)
+        try:
+            with os.scandir(path) as it:
+                items = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        for entry in items:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if (is_dir and entry.name in DEFAULT_IGNORES) or rules.ignored(rel, is_dir):
+                continue
+            if is_dir and level < depth:
+                queue.append((entry.path, rel, level + 1, rules))
+            shown = rel[len(base) + 1:] if base else rel
+            if match is not None and (is_dir or not match(shown)):
+                continue
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            entries.append(TreeEntry(path=shown + "/" if is_dir else shown, size=st.st_size, mtime=st.st_mtime))
+            if len(entries) >= max_entries:
+                truncated = True
+                break
+    entries.sort(key=lambda e: e.path)
+    return TreeListing(directory=directory.rstrip("/") or ".", depth=depth, entries=entries, truncated=truncated)
+
+
+def walk_files(root: str) -> Iterator[Tuple[str, os.DirEntry]]:
+    """Every file under `root` as (relative path, DirEntry), with the same ignore rules as list_tree."""
+    stack = [(root, "", IgnoreRules())]
+    while stack:
+        path, rel_dir, rules = stack.pop()
+        rules = rules.child(path, rel_dir)
+        try:
+            with os.scandir(path) as it:
+                items = list(it)
+        except OSError:
+            continue
+        for entry in items:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in DEFAULT_IGNORES and not rules.ignored(rel, True):
+                    stack.append((entry.path, rel, rules))
+            elif entry.is_file(follow_symlinks=False) and not rules.ignored(rel, False):
+                yield rel, entry
+
+
+MAX_BATCH_FILES = 50
+BATCH_WORKERS = 8
+MIN_BATCH_BYTES = 4_000  # per-file floor when a batch read splits its byte budget
+
+
+class FileStatus(BaseModel):
+    path: str
+    ok: bool
+    error: Optional[str] = None
+    bytes: int = 0
+    chunk: Optional[FileChunk] = None  # reads only
+
+
+class BatchResult(BaseModel):
+    action: str  # "Read" or "Wrote"
+    files: List[FileStatus]
+
+    def render(self) -> str:
+        done = sum(f.ok for f in self.files)
+        lines = [f"{self.action} {done} of {len(self.files)} files"]
+        for f in self.files:
+            if not f.ok:
+                lines.append(f"==> {f.path} <== failed: {f.error}")
+            elif f.chunk is not None:
+                lines += [f"==> {f.path} <==", f.chunk.render()]
+            else:
+                lines.append(f"==> {f.path} <== {f.bytes} bytes")
+        return "\n".join(lines)
+
+
+def _json_arg(text: str, name: str) -> Any:
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"`{name}` is not valid JSON: {e}") from None
+
+
+def parse_paths(value: Any) -> List[str]:
+    """File list argument: a list, a JSON array, or paths separated by newlines or commas."""
+    if isinstance(value, str):
+        text = value.strip()
+        value = _json_arg(text, "filepaths") if text.startswith("[") else re.split(r"[\n,]", text)
+    paths = [str(p).strip() for p in value if str(p).strip()]
+    if not paths:
+        raise ValueError("No file paths given")
+    if len(paths) > MAX_BATCH_FILES:
+        raise ValueError(f"At most {MAX_BATCH_FILES} files per call, got {len(paths)}")
+    return paths
+
+
+def parse_files(value: Any) -> List[Tuple[str, str]]:
+    """Files argument for batch writes: {path: content}, or a list of {"filepath", "content"}
+    objects, either as is or as a JSON string."""
+    if isinstance(value, str):
+        value = _json_arg(value, "files")
+    if isinstance(value, dict):
+        files = list(value.items())
+    elif isinstance(value, list) and all(isinstance(f, dict) for f in value):
+        files = [(f.get("filepath") or f.get("path"), f.get("content")) for f in value]
+    else:
+        raise ValueError('Expected {"path": "content", ...} or [{"filepath": ..., "content": ...}, ...]')
+    for path, content in files:
+        if not isinstance(path, str) or not isinstance(content, str):
+            raise ValueError(f"Each file needs a string path and content (got {path!r})")
+    if not files:
+        raise ValueError("No files given")
+    if len(files) > MAX_BATCH_FILES:
+        raise ValueError(f"At most {MAX_BATCH_FILES} files per call, got {len(files)}")
+    return files
+
+
+def _run_batch(func: Callable[[Any], FileStatus], items: list, max_workers: int) -> List[FileStatus]:
+    if len(items) == 1:
+        return [func(items[0])]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        return list(pool.map(func, items))
+
+
+def read_files(paths: List[str], resolve: Callable[[str], str], max_bytes: int = DEFAULT_MAX_BYTES,
+               cache=None, max_workers: int = BATCH_WORKERS) -> BatchResult:
+    """Read several files in parallel. `resolve` maps a path to its full (jailed) path;
+    `max_bytes` is split across the files, and a capped file carries a continuation."""
+    per_file = max(max_bytes // len(paths), MIN_BATCH_BYTES)
+
+    def read_one(path: str) -> FileStatus:
+        try:
+            chunk = read_chunk(resolve(path), path, max_bytes=per_file, cache=cache)
+            return FileStatus(path=path, ok=True, bytes=chunk.size, chunk=chunk)
+        except Exception as e:
+            return FileStatus(path=path, ok=False, error=str(e))
+
+    return BatchResult(action="Read", files=_run_batch(read_one, paths, max_workers))
+
+
+def write_files(files: List[Tuple[str, str]], resolve: Callable[[str], str],
+                on_written: Optional[Callable[[str], None]] = None, max_workers: int = BATCH_WORKERS) -> BatchResult:
+    """Write several files in parallel, each atomically. `on_written(full_path)` runs after
+    each successful write (cache invalidation, index updates)."""
+    def write_one(item: Tuple[str, str]) -> FileStatus:
+        path, content = item
+        try:
+            full_path = resolve(path)
+            write_atomic(full_path, content)
+            if on_written is not None:
+                on_written(full_path)
+            return FileStatus(path=path, ok=True, bytes=len(content.encode("utf-8")))
+        except Exception as e:
+            return FileStatus(path=path, ok=False, error=str(e))
+
+    paths = [path for path, _ in files]
+    if len(set(paths)) != len(paths):
+        raise ValueError("The same path is given more than once")
+    return BatchResult(action="Wrote", files=_run_batch(write_one, files, max_workers))
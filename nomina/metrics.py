@@ -0,0 +1,179 @@
+"""
+Per-turn and per-tool instrumentation for NominaLlm with a Prometheus text exporter.
+"""
+import json
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class TurnStats(BaseModel):
+    """One model round trip of the tool loop plus the tool phase that followed it."""
+    model: str
+    serialize_seconds: float = 0.0
+    http_seconds: float = 0.0
+    ttft_seconds: Optional[float] = None
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cache_read_tokens: int = 0  # prompt tokens served from the provider's prompt cache
+    cache_write_tokens: int = 0  # prompt tokens written to it
+    tool_calls: int = 0
+    tool_seconds: float = 0.0
+    retries: int = 0
+    failed_models: List[str] = []  # models given up on for this turn (see ModelRouter)
+    throttle_seconds: float = 0.0  # held back by the client-side rate limiter
+
+    def summary(self) -> str:
+        parts = [f"http {self.http_seconds:.2f}s"]
+        if self.ttft_seconds is not None:
+            parts.append(f"ttft {self.ttft_seconds:.2f}s")
+        parts.append(f"tokens {self.prompt_tokens}/{self.completion_tokens}")
+        if self.cache_read_tokens or self.cache_write_tokens:
+            parts.append(f"cached {self.cache_read_tokens} read/{self.cache_write_tokens} written")
+        if self.tool_calls:
+            parts.append(f"{self.tool_calls} tools {self.tool_seconds:.2f}s")
+        if self.retries:
+            parts.append(f"{self.retries} retries")
+        if self.failed_models:
+            parts.append(f"failed over from {', '.join(self.failed_models)}")
+        if self.throttle_seconds >= 0.01:
+            parts.append(f"throttled {self.throttle_seconds:.2f}s")
+        return ", ".join(parts)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    """Exposition form of a sample value: integers exactly, other floats round-tripping."""
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    items = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        items.append(extra)
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+class Metrics:
+    """Thread-safe counters and histograms. One instance can be shared by several
+    NominaLlm instances (e.g. all sessions of the API server)."""
+    HELP = {
+        "nomina_turns_total": ("counter", "Model round trips made by the tool loop"),
+        "nomina_request_errors_total": ("counter", "Failed model requests"),
+        "nomina_request_retries_total": ("counter", "Model requests repeated after a transient failure"),
+        "nomina_model_failovers_total": ("counter", "Requests moved to another model after a failure"),
+        "nomina_tokens_total": ("counter", "Tokens reported in the usage block"),
+        "nomina_bytes_total": ("counter", "Request/response body bytes"),
+        "nomina_tool_calls_total": ("counter", "Tool invocations"),
+        "nomina_tool_errors_total": ("counter", "Tool invocations that raised"),
+        "nomina_tool_result_chars_total": ("counter", "Characters of tool results added to conversations"),
+        "nomina_request_seconds": ("histogram", "Model request latency"),
+        "nomina_time_to_first_token_seconds": ("histogram", "Time to first streamed token"),
+        "nomina_serialize_seconds": ("histogram", "Request payload serialisation time"),
+        "nomina_tool_seconds": ("histogram", "Tool execution time"),
+        "nomina_file_cache_requests_total": ("counter", "File content cache lookups by result"),
+        "nomina_file_cache_evictions_total": ("counter", "Entries evicted to stay within the byte budget"),
+        "nomina_file_cache_bytes": ("gauge", "Bytes held by the file content cache"),
+        "nomina_file_cache_entries": ("gauge", "Files held by the file content cache"),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, tuple], float] = {}
+        self.gauges: Dict[Tuple[str, tuple], float] = {}
+        self.histograms: Dict[Tuple[str, tuple], Histogram] = {}
+        self.last_turn: Optional[TurnStats] = None
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    def record_turn(self, turn: TurnStats):
+        self.last_turn = turn
+        self.inc("nomina_turns_total", model=turn.model)
+        self.inc("nomina_tokens_total", turn.prompt_tokens, model=turn.model, type="prompt")
+        self.inc("nomina_tokens_total", turn.completion_tokens, model=turn.model, type="completion")
+        if turn.cache_read_tokens or turn.cache_write_tokens:
+            self.inc("nomina_tokens_total", turn.cache_read_tokens, model=turn.model, type="cache_read")
+            self.inc("nomina_tokens_total", turn.cache_write_tokens, model=turn.model, type="cache_write")
+        self.inc("nomina_bytes_total", turn.bytes_sent, direction="sent")
+        self.inc("nomina_bytes_total", turn.bytes_received, direction="received")
+        self.observe("nomina_request_seconds", turn.http_seconds, model=turn.model)
+        self.observe("nomina_serialize_seconds", turn.serialize_seconds)
+        if turn.ttft_seconds is not None:
+            self.observe("nomina_time_to_first_token_seconds", turn.ttft_seconds, model=turn.model)
+
+    def record_tool(self, name: str, seconds: float, error: bool = False):
+        self.inc("nomina_tool_calls_total", tool=name)
+        if error:
+            self.inc("nomina_tool_errors_total", tool=name)
+        self.observe("nomina_tool_seconds", seconds, tool=name)
+
+    def to_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format (0.0.4)."""
+        lines, seen = [], set()
+
+        def header(name):
+            if name not in seen:
+                seen.add(name)
+                kind, text = self.HELP.get(name, ("untyped", name))
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = sorted(self.counters.items()) + sorted(self.gauges.items())
+            histograms = sorted(self.histograms.items(), key=lambda kv: kv[0])
+            histograms = [(key, (list(h.buckets), list(h.counts), h.count, h.sum)) for key, h in histograms]
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), (buckets, counts, count, total) in histograms:
+            header(name)
+            for bound, n in zip(buckets, counts):
+                lines.append(f"{name}_bucket{_labels(labels, 'le=%s' % json.dumps(_number(bound)))} {n}")
+            lines.append(f"{name}_bucket{_labels(labels, 'le=' + json.dumps('+Inf'))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
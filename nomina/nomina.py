@@ -1,12 +1,23 @@
+import argparse
 import os
-import subprocess
+import threading
 from textual.app import App
 from textual.containers import Container, Horizontal, Vertical
 from textual.widgets import Header, Footer, Static, TextArea, Input, Button, Label, Select, Tabs
 from textual import on
 from textual.binding import Binding
 from textual.worker import Worker
-from .nominallm import NominaLlm
+from .nominallm import AsyncNominaLlm, NominaLlm
+from .compaction import HistoryCompactor, make_summarizer
+from .shell import run_shell, parse_timeout
+from .fileops import (read_chunk, list_tree as list_tree_entries, read_files as read_many, write_files as write_many,
+                      parse_paths, parse_files, DEFAULT_MAX_ENTRIES)
+from .search import get_index, parse_flag
+from .filecache import FileCache
+from .routing import add_routing_arguments, router_from_args
+from .toolresults import SHELL_POLICY
+from .store import ConversationLog, data_dir, log_name, root_dir
+from .edits import apply_edit as apply_file_edit
 from . import TabsWithClose
 from textual.widgets import Tab
 import re
@@ -24,6 +35,7 @@ You are Nomina, an autonomous coding and shell assistant.
 - When asked to add new features, do the following:
     1. Read relevant files.
     2. Modify and save files using tools.
+    - Prefer apply_edit for changes to existing files; use write_file for new files or full rewrites.
     3. Use the shell tool to test your changes.
     4. If tests fail, refine and retry.
 - Repeat steps 1-4 until confident it works.
@@ -40,6 +52,7 @@ You are Nomina, an autonomous coding and shell assistant.
 - When asked to add new features, do the following:
     1. Read relevant files.
     2. Modify and save files using tools.
+    - Prefer apply_edit for changes to existing files; use write_file for new files or full rewrites.
     - Repeat steps 1-2 until confident it works.
 - Avoid repeated narration; take action instead.
 - Always report your **final status** succinctly.
@@ -58,10 +71,18 @@ class StatusBar(Static):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.status = "Ready"
+        self.metrics = ""
+
+    def _render_status(self) -> None:
+        self.update(f"Status: {self.status}" + (f"  |  {self.metrics}" if self.metrics else ""))
 
     def update_status(self, message: str) -> None:
         self.status = message
-        self.update(f"Status: {self.status}")
+        self._render_status()
+
+    def update_metrics(self, text: str) -> None:
+        self.metrics = text
+        self._render_status()
 
 
 class FileViewer(Container):
@@ -86,6 +107,46 @@ class FileViewer(Container):
         if tabs.active != tab_id:
             tabs.active = tab_id
 
+    def append_content(self, title: str, text: str) -> None:
+        tab_id = _sanitize_id(title)
+        _, content, language = self.tab_contents.get(tab_id, (title, "", "python"))
+        self.tab_contents[tab_id] = (title, content + text, language)
+        tabs = self.query_one("#file-tabs", TabsWithClose)
+        if tabs.active == tab_id:
+            file_content = self.query_one("#file-content", TextArea)
+            file_content.insert(text, file_content.document.end)
+            file_content.scroll_end(animate=False)
+
+    def patch_content(self, title: str, old_text: str, hunks, new_text: str) -> None:
+        """Show an edit: replace only the changed lines when the tab holds the old text,
+        otherwise show the changed regions with their new line numbers."""
+        tab_id = _sanitize_id(title)
+        stored = self.tab_contents.get(tab_id)
+        if stored is None or stored[1] != old_text:
+            lines = new_text.splitlines()
+            regions = []
+            for h in hunks:
+                first = max(h.new_start - 3, 1)
+                last = min(h.new_start + h.new_lines + 1, len(lines))
+                regions.append("\n".join(f"{n:>5}  {lines[n - 1]}" for n in range(first, last + 1)))
+            self.set_content(title, "\n  ...\n".join(regions))
+            return
+        self.tab_contents[tab_id] = (title, new_text, stored[2])
+        tabs = self.query_one("#file-tabs", TabsWithClose)
+        if tabs.active != tab_id:
+            tabs.active = tab_id  # the tab switch loads the stored (new) text
+            return
+        file_content = self.query_one("#file-content", TextArea)
+        for h in reversed(hunks):  # bottom-up so earlier rows stay valid
+            start = (h.old_start - 1, 0)
+            end = (h.old_start - 1 + h.old_lines, 0)
+            if end[0] >= file_content.document.line_count:
+                end = file_content.document.end
+            file_content.replace(h.text, start, end)
+        if file_content.text != new_text:  # e.g. a missing final newline; fall back to a full reload
+            file_content.text = new_text
+        file_content.scroll_to(y=max(hunks[0].new_start - 3, 0), animate=False)
+
     def add_tab(self, title: str) -> None:
         tab_id = _sanitize_id(title)
         if tab_id in self.added_tabs:
@@ -131,12 +192,16 @@ class ChatPanel(Container):
 
         #yield Label("Type your message... (or click Send)", id="chat-hint")
 
+    @staticmethod
+    def _header(sender: str) -> str:
+        prefix = "You:" if sender == "user" else f"\U0001F916 {sender}:"
+        return f"{prefix}\n---------------\n"
+
     def add_message(self, sender: str, message: str) -> None:
         chat_area = self.query_one("#chat-history", TextArea)
-        prefix = "You:" if sender == "user" else f"\U0001F916 {sender}:"
         #prefix = sender
         current_text = chat_area.text
-        new_text = current_text + f"{prefix}\n---------------\n{message}\n\n"
+        new_text = current_text + f"{self._header(sender)}{message}\n\n"
         chat_area.text = new_text
 
         line_count = new_text.count('\n')
@@ -146,6 +211,21 @@ class ChatPanel(Container):
                 chat_area.scroll_down(animate=False)
         self.query_one("#chat-input", TextArea).focus()
 
+    def begin_message(self, sender: str) -> None:
+        """Start a message whose body arrives incrementally via `append_to_message`."""
+        chat_area = self.query_one("#chat-history", TextArea)
+        chat_area.text = chat_area.text + self._header(sender)
+        chat_area.scroll_end(animate=False)
+
+    def append_to_message(self, text: str) -> None:
+        chat_area = self.query_one("#chat-history", TextArea)
+        chat_area.insert(text, chat_area.document.end)
+        chat_area.scroll_end(animate=False)
+
+    def end_message(self) -> None:
+        self.append_to_message("\n\n")
+        self.query_one("#chat-input", TextArea).focus()
+
     @on(Button.Pressed, "#send-button")
     def send_button_pressed(self):
         self.submit_message()
@@ -161,6 +241,17 @@ class ChatPanel(Container):
         input_widget.focus()
 
 
+def model_label(model: dict) -> str:
+    """Picker label: name, context size and USD per million prompt/completion tokens."""
+    label = model["name"]
+    if model.get("context_length"):
+        label += f" · {model['context_length'] // 1000}k ctx"
+    pricing = model.get("pricing") or {}
+    if "prompt" in pricing and "completion" in pricing:
+        label += f" · ${pricing['prompt'] * 1e6:.2f}/${pricing['completion'] * 1e6:.2f} per M"
+    return label
+
+
 class ModelPicker(Container):
     def compose(self):
         yield Label("Select OpenRouter Model:", id="model-label")
@@ -174,20 +265,12 @@ class ModelPicker(Container):
         self.app.run_worker(self.load_models, exclusive=True, name="fetch_models")
 
     async def load_models(self) -> None:
-        import asyncio
-
-        def blocking_fetch():
-            try:
-                models = self.app.llm.list_models()
-                return [(m["name"], m["id"]) for m in models]
-            except Exception as e:
-                return f"Model fetch failed: {e}"
-
-        loop = asyncio.get_event_loop()
-        options = await loop.run_in_executor(None, blocking_fetch)
-        if isinstance(options, str):
-            self.app.update_status(options)
+        try:
+            models = await self.app.llm.list_models()
+        except Exception as e:
+            self.app.update_status(f"Model fetch failed: {e}")
             return
+        options = [(model_label(m), m["id"]) for m in models]
         container = self
         old_select = container.query_one("#model-select", Select)
         await old_select.remove()
@@ -283,6 +366,20 @@ class SimpleTUI(App):
         except Exception as e:
             self.update_status(f"UI update error: {e}")
 
+    def patch_file_content(self, title: str, old_text: str, hunks, new_text: str) -> None:
+        try:
+            viewer = self.query_one("#file-viewer", FileViewer)
+            viewer.add_tab(title)
+            viewer.patch_content(title, old_text, hunks, new_text)
+        except Exception as e:
+            self.update_status(f"UI update error: {e}")
+
+    def append_file_content(self, title: str, text: str) -> None:
+        try:
+            self.query_one("#file-viewer", FileViewer).append_content(title, text)
+        except Exception as e:
+            self.update_status(f"UI update error: {e}")
+
     def add_chat_message(self, sender: str, message: str) -> None:
         chat_panel = self.query_one("#chat-panel", ChatPanel)
         chat_panel.add_message(sender, message)
@@ -291,11 +388,15 @@ class SimpleTUI(App):
         status_bar = self.query_one("#status-bar", StatusBar)
         status_bar.update_status(message)
 
+    def update_metrics(self, text: str) -> None:
+        status_bar = self.query_one("#status-bar", StatusBar)
+        status_bar.update_metrics(text)
+
 
 def safe_path(path):
-    jail_dir = os.getcwd()
+    jail_dir = os.path.realpath(os.getcwd())
     abs_path = os.path.abspath(os.path.join(jail_dir, path))
-    if not abs_path.startswith(jail_dir):
+    if os.path.commonpath([jail_dir, os.path.realpath(abs_path)]) != jail_dir:
         raise Exception(f"Access outside jail is denied: {abs_path}")
     return abs_path
 
@@ -307,6 +408,8 @@ def make_write_file_tool(app):
             os.makedirs(os.path.dirname(full_path), exist_ok=True)
             with open(full_path, "w") as f:
                 f.write(content)
+            app.file_cache.invalidate(full_path)
+            get_index(os.getcwd()).notify(full_path)
 
             def update_ui():
                 app.set_file_content(filepath, content)
@@ -318,35 +421,100 @@ def make_write_file_tool(app):
     return write_file
 
 
+def make_apply_edit_tool(app):
+    def apply_edit(filepath, edit):
+        """Change part of a file instead of rewriting it. `edit` is one or more blocks of
+        <<<<<<< SEARCH
+        exact existing lines
+        =======
+        replacement lines
+        >>>>>>> REPLACE
+        (each SEARCH must match exactly once; an empty SEARCH creates a new file) or a unified
+        diff with @@ hunks. All edits apply together or not at all."""
+        try:
+            full_path = safe_path(filepath)
+            result = apply_file_edit(full_path, edit, filepath)
+            app.file_cache.invalidate(full_path)
+            get_index(os.getcwd()).notify(full_path)
+
+            def update_ui():
+                app.patch_file_content(filepath, result.old_text, result.hunks, result.new_text)
+            app.call_from_thread(update_ui)
+            return result.render()
+        except Exception as e:
+            raise RuntimeError(f"apply_edit failed: {e}")
+
+    return apply_edit
+
+
 def make_read_file_tool(app):
-    def read_file(filepath):
+    def read_file(filepath, lines=None, byte_range=None, continuation=None):
+        """Read a text file, at most 100 kB per call. Optional `lines` ("120-200") or
+        `byte_range` ("0-4096") select part of it; a partial read ends with a footer giving the
+        range and, if more follows, a `continuation` to pass back for the next chunk."""
         try:
-            full = safe_path(filepath)
-            with open(full) as f:
-                content = f.read()
+            chunk = read_chunk(safe_path(filepath), filepath, lines, byte_range, continuation, cache=app.file_cache)
 
             def update_ui():
-                app.set_file_content(filepath, content)
+                app.set_file_content(filepath, chunk.content)
             app.call_from_thread(update_ui)
-            return content
+            return chunk.render()
         except Exception as e:
             raise RuntimeError(f"read_file failed: {e}")
 
     return read_file
 
 
+def make_read_files_tool(app):
+    def read_files(filepaths):
+        """Read several text files in one call. `filepaths` is a JSON array of paths (or one
+        path per line). The 100 kB budget is shared between the files; a capped file ends with
+        a `continuation` footer for read_file."""
+        try:
+            result = read_many(parse_paths(filepaths), safe_path, cache=app.file_cache)
+
+            def update_ui():
+                for f in result.files:
+                    if f.ok:
+                        app.set_file_content(f.path, f.chunk.content)
+            app.call_from_thread(update_ui)
+            return result.render()
+        except Exception as e:
+            raise RuntimeError(f"read_files failed: {e}")
+
+    return read_files
+
+
+def make_write_files_tool(app):
+    def write_files(files):
+        """Write several files in one call. `files` is a JSON object mapping each path to its
+        full content. Each file is written atomically; the result lists every file's status."""
+        try:
+            files = parse_files(files)
+            contents = dict(files)
+
+            def written(full_path):
+                app.file_cache.invalidate(full_path)
+                get_index(os.getcwd()).notify(full_path)
+            result = write_many(files, safe_path, on_written=written)
+
+            def update_ui():
+                for f in result.files:
+                    if f.ok:
+                        app.set_file_content(f.path, contents[f.path])
+            app.call_from_thread(update_ui)
+            return result.render()
+        except Exception as e:
+            raise RuntimeError(f"write_files failed: {e}")
+
+    return write_files
+
+
 def make_list_files_tool(app):
     def list_files(directory):
         try:
-            full_path = safe_path(directory)
-            entries = os.listdir(full_path)
-            lines = []
-            for entry in entries:
-                entry_path = os.path.join(full_path, entry)
-                if os.path.isdir(entry_path):
-                    lines.append(entry + "/")
-                else:
-                    lines.append(entry)
+            with os.scandir(safe_path(directory)) as it:
+                lines = [entry.name + "/" if entry.is_dir() else entry.name for entry in it]
             output = "The directory contains:\n" + "\n".join(sorted(lines))
 
             def update_ui():
@@ -359,11 +527,33 @@ def make_list_files_tool(app):
     return list_files
 
 
+def make_list_tree_tool(app):
+    def list_tree(directory=".", depth="3", pattern=None, max_entries=str(DEFAULT_MAX_ENTRIES)):
+        """Recursively list `directory` with sizes and modification times, `depth` levels deep,
+        skipping .git, node_modules and .gitignore'd paths. `pattern` ("*.py", "src/**/test_*.py")
+        keeps only matching files. Use this to map a project in one call."""
+        try:
+            listing = list_tree_entries(safe_path(directory), directory, int(depth), pattern or None,
+                                        int(max_entries), root=os.getcwd())
+            output = listing.render()
+
+            def update_ui():
+                app.set_file_content(f"tree {directory}/", output)
+            app.call_from_thread(update_ui)
+            return output
+        except Exception as e:
+            raise RuntimeError(f"list_tree failed: {e}")
+
+    return list_tree
+
+
 def make_delete_file_tool(app):
     def delete_file(filepath):
         try:
             full_path = safe_path(filepath)
             os.remove(full_path)
+            app.file_cache.invalidate(full_path)
+            get_index(os.getcwd()).notify(full_path)
             return f"File deleted: {filepath}"
         except Exception as e:
             raise RuntimeError(f"delete_file failed: {e}")
@@ -388,6 +578,7 @@ def make_remove_directory_tool(app):
         try:
             full_path = safe_path(directory)
             os.rmdir(full_path)
+            get_index(os.getcwd()).mark_stale()
             return f"Directory removed: {directory}"
         except Exception as e:
             raise RuntimeError(f"remove_directory failed: {e}")
@@ -395,15 +586,52 @@ def make_remove_directory_tool(app):
     return remove_directory
 
 
-def make_shell_command_tool(app):
-    def shell_command(command):
+def make_search_files_tool(app):
+    def search_files(query, regex="false", glob=None, case_sensitive="false", max_results="100"):
+        """Search file contents in the working directory (indexed, much faster than grep via
+        shell_command). `query` is a substring, or a Python regex with regex="true"; `glob`
+        ("*.py", "src/**/*.ts") limits the files. Returns path:line: text for each match."""
         try:
-            result = subprocess.run(command, shell=True, capture_output=True, text=True)
+            result = get_index(os.getcwd()).search(query, regex=parse_flag(regex), case_sensitive=parse_flag(case_sensitive),
+                                                   glob=glob or None, max_results=int(max_results))
+            output = result.render()
 
             def update_ui():
-                app.set_file_content(command, f"{result.stdout}\n{result.stderr}")
+                app.set_file_content(f"search {query}", output)
             app.call_from_thread(update_ui)
-            return {"stdout": result.stdout, "stderr": result.stderr, "returncode": result.returncode}
+            return output
+        except Exception as e:
+            raise RuntimeError(f"search_files failed: {e}")
+
+    return search_files
+
+
+SHELL_VIEWER_LIMIT = 200_000  # characters of live output shown per command
+
+
+def make_shell_command_tool(app):
+    def shell_command(command, timeout=None):
+        """Run a shell command in the working directory. `timeout` is in seconds (default 120,
+        max 1800); the process group is killed when it expires. Long output keeps its start and end."""
+        shown = 0
+
+        def on_output(stream, text):
+            nonlocal shown
+            if shown >= SHELL_VIEWER_LIMIT:
+                return
+            shown += len(text)
+            if shown >= SHELL_VIEWER_LIMIT:
+                text += "\n[... further output not shown ...]\n"
+            app.call_from_thread(app.append_file_content, command, text)
+
+        try:
+            app.call_from_thread(app.set_file_content, command, "")
+            result = run_shell(command, cwd=os.getcwd(), timeout=parse_timeout(timeout), cpu_limit=app.shell_cpu_limit,
+                               on_output=on_output)
+            get_index(os.getcwd()).mark_stale()
+            app.call_from_thread(app.append_file_content, command,
+                                 f"\n[exit {result['returncode']} after {result['seconds']}s]\n")
+            return result
         except Exception as e:
             raise RuntimeError(f"shell_command failed: {e}")
 
@@ -411,44 +639,116 @@ def make_shell_command_tool(app):
 
 
 class MyApp(SimpleTUI):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, session: str = None, resume: bool = False, history_dir: str = None,
+                 model: str = None, router=None, fast_model: str = None, shell_cpu_limit: int = None, **kwargs):
+        """With a `session` name the conversation is logged under `history_dir`; `resume`
+        continues the logged conversation instead of archiving it and starting afresh.
+        `router` spreads requests over a pool of models; `fast_model` summarises older
+        turns when the history is compacted; `shell_cpu_limit` caps the CPU seconds of each
+        shell command."""
         super().__init__(*args, **kwargs)
-        self.llm = NominaLlm()
+        self.llm = AsyncNominaLlm(compactor=HistoryCompactor(), router=router, fast_model=fast_model)
+        if model:
+            self.llm.default_model = model
+        self.summary_llm = None
+        if fast_model:
+            # the compactor calls its summarizer synchronously, off the event loop
+            self.summary_llm = NominaLlm(default_model=fast_model, metrics=self.llm.metrics,
+                                         rate_limiter=self.llm.rate_limiter)
+            self.llm.compactor.summarizer = make_summarizer(self.summary_llm)
+        self.file_cache = FileCache(metrics=self.llm.metrics)
+        self.shell_cpu_limit = shell_cpu_limit
         self.system_prompt = system_prompt
         self.history = [self.llm.make_text_message("system", self.system_prompt)]
+        self.session_tokens = 0
+        self.conversation_log = None
+        self.log_start = 0  # logged messages before history[1]
+        if session:
+            self.conversation_log = ConversationLog(root_dir(history_dir or data_dir(), os.getcwd()), log_name(session))
+            if resume:
+                self.log_start, messages = self.conversation_log.tail()
+                self.history += messages
+            else:
+                self.conversation_log.archive()
 
     def on_mount(self):
         super().on_mount()
         self.llm.add_tool(make_write_file_tool(self))
-        self.llm.add_tool(make_read_file_tool(self))
-        self.llm.add_tool(make_list_files_tool(self))
+        self.llm.add_tool(make_write_files_tool(self))
+        self.llm.add_tool(make_apply_edit_tool(self))
+        self.llm.add_tool(make_read_file_tool(self), parallel=True)
+        self.llm.add_tool(make_read_files_tool(self), parallel=True)
+        self.llm.add_tool(make_list_files_tool(self), parallel=True)
+        self.llm.add_tool(make_list_tree_tool(self), parallel=True)
+        self.llm.add_tool(make_search_files_tool(self), parallel=True)
         self.llm.add_tool(make_delete_file_tool(self))
         self.llm.add_tool(make_create_directory_tool(self))
         self.llm.add_tool(make_remove_directory_tool(self))
-        self.llm.add_tool(make_shell_command_tool(self))
+        self.llm.add_tool(make_shell_command_tool(self), result_policy=SHELL_POLICY)
+        threading.Thread(target=get_index(os.getcwd()).refresh, daemon=True).start()  # warm the search index
+        self.run_worker(self.llm.list_models, name="warm_models", group="models", exit_on_error=False)  # so F2 opens at once
+        for message in self.history[1:]:
+            if message.role in ("user", "assistant") and isinstance(message.content, str) and message.content:
+                self.add_chat_message(message.role, message.content)
+
+    async def on_unmount(self) -> None:
+        await self.llm.aclose()
+        if self.summary_llm is not None:
+            self.summary_llm.close()
+        if self.conversation_log is not None:
+            self.conversation_log.close()
+
+    def persist(self) -> None:
+        if self.conversation_log is not None:
+            self.conversation_log.update(self.history, skipped=self.log_start)
 
     def on_message_submitted(self, message: str) -> None:
         self.add_chat_message("user", message)
         self.update_status(f"{self.llm.default_model} is thinking... ")
         self.history.append(self.llm.make_text_message("user", message))
+        self.persist()
         self.run_worker(self.llm_worker, exclusive=True, name="llm")
 
     async def llm_worker(self) -> None:
-        import asyncio
-
-        async def run_in_thread(func, *args, **kwargs):
-            loop = asyncio.get_event_loop()
-            return await loop.run_in_executor(None, func, *args, **kwargs)
-
-        response = await run_in_thread(self.llm.chat, self.history)
-        reply = response.get("choices", [{}])[0].get("message", {}).get("content", "")
-        self.add_chat_message(self.llm.default_model, reply)
-        self.history.append(self.llm.make_text_message("assistant", reply))
+        chat_panel = self.query_one("#chat-panel", ChatPanel)
+        chat_panel.begin_message(self.llm.default_model)
+        async for event in self.llm.stream_chat(self.history, retain_tool_turns=True):
+            if event["type"] == "token":
+                chat_panel.append_to_message(event["content"])
+            elif event["type"] == "tool_call":
+                self.update_status(f"Running {event['name']}...")
+            elif event["type"] == "tool_result":
+                outcome = "failed" if event["error"] else "done"
+                self.update_status(f"{event['name']} {outcome} in {event['seconds']:.2f}s")
+            elif event["type"] == "retry":
+                if event["partial"]:
+                    chat_panel.append_to_message("\n[connection lost, retrying]\n")
+                self.update_status(f"Request failed ({event['error']}); retry {event['attempt']} with {event['model']}"
+                                   f" in {event['delay']:.1f}s")
+            elif event["type"] == "turn":
+                self.persist()  # the finished round is already in self.history
+                stats = self.llm.last_turn
+                self.session_tokens += stats.prompt_tokens + stats.completion_tokens
+                cache = self.file_cache.stats()
+                self.update_metrics(f"last turn: {stats.summary()}  |  session tokens: {self.session_tokens}"
+                                    f"  |  file cache: {cache['hits']}/{cache['hits'] + cache['misses']} hits")
+        chat_panel.end_message()
         self.update_status("Ready")
 
 
 def main():
-    app = MyApp()
+    parser = argparse.ArgumentParser(description="Nomina terminal assistant")
+    parser.add_argument("--session", "-s", help="Name the conversation is logged under", default="default")
+    parser.add_argument("--resume", "-r", help="Continue the logged conversation", action="store_true")
+    parser.add_argument("--history-dir", help="Where conversation logs are kept", default=data_dir())
+    parser.add_argument("--no-history", help="Don't log the conversation", action="store_true")
+    parser.add_argument("--shell-cpu-limit", help="CPU seconds each shell command may use (0: no limit)",
+                        type=int, default=0)
+    add_routing_arguments(parser, "openrouter/optimus-alpha")
+    args = parser.parse_args()
+    model, router = router_from_args(args)
+    app = MyApp(session=None if args.no_history else args.session, resume=args.resume, history_dir=args.history_dir,
+                model=model, router=router, fast_model=args.fast_model, shell_cpu_limit=args.shell_cpu_limit or None)
     app.run()
 
 
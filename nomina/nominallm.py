@@ -1,6 +1,14 @@
-import os, json, inspect, requests
+import os, json, time, asyncio, functools, inspect, itertools, socket, threading, requests, httpx
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional, Union, Literal, Callable
 from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
+from .catalog import get_catalog
+from .compaction import HistoryCompactor, as_message, elide, estimate_tokens
+from .metrics import Metrics, TurnStats
+from .retry import RateLimiter, RetryPolicy, parse_retry_after
+from .routing import ModelRouter
+from .toolresults import ResultDeduper, ResultPolicy, render_result, restore_pointers
 
 class ToolCallFunction(BaseModel):
     name: str
@@ -17,6 +25,7 @@ class MultiModalContent(BaseModel):
     type: Literal["text", "image_url"]
     text: Optional[str] = None
     image_url: Optional[dict] = None
+    cache_control: Optional[dict] = None  # {"type": "ephemeral"}: cache the prompt up to this part
     class Config: exclude_none = True
 
 class Message(BaseModel):
@@ -45,23 +54,193 @@ class ChatPayload(BaseModel):
     tools: Optional[List[Tool]] = None
     tool_choice: Optional[Union[str, dict]] = None
     stream: Optional[bool] = None
+    usage: Optional[dict] = None  # OpenRouter usage accounting (reports cached tokens)
     class Config: exclude_none = True
 
 
-class NominaLlm:
-    def __init__(self, api_key=None, site_url="", site_name="", default_model="openrouter/optimus-alpha"):
+class PayloadEncoder:
+    """Serialises ChatPayloads to request bodies, reusing the JSON of every message and
+    of the tool list already encoded, so each round of the tool loop only serialises the
+    messages added since the last one. Messages are treated as immutable once sent -
+    replace them (as compaction and cache hints do) rather than mutating them in place.
+    Only the messages of the latest body are kept, so the cache never outgrows the
+    conversation; conversations sharing one encoder just evict each other's entries."""
+    def __init__(self):
+        self._messages: Dict[int, tuple] = {}  # id(message) -> (message, JSON bytes)
+        self._tools = ((), b"")
+
+    @staticmethod
+    def _entry(msg, cache) -> tuple:
+        entry = cache.get(id(msg))
+        if entry is None or entry[0] is not msg:
+            entry = (msg, json.dumps(as_message(msg).model_dump(exclude_none=True)).encode())
+        return entry
+
+    def encode(self, payload: ChatPayload) -> bytes:
+        """The same bytes as `json.dumps(payload.model_dump(exclude_none=True))`."""
+        cache, fresh = self._messages, {}
+        parts = []
+        for msg in payload.messages:
+            entry = fresh[id(msg)] = self._entry(msg, cache)
+            parts.append(entry[1])
+        self._messages = fresh
+        tools = tuple(payload.tools or ())
+        cached_tools, tools_json = self._tools
+        if len(tools) != len(cached_tools) or any(a is not b for a, b in zip(tools, cached_tools)):
+            tools_json = json.dumps([t.model_dump(exclude_none=True) for t in tools]).encode()
+            self._tools = (tools, tools_json)
+        rest = payload.model_dump(exclude_none=True, exclude={"messages", "tools"})
+        fields = []
+        for name in ChatPayload.model_fields:
+            if name == "messages":
+                fields.append(b'"messages": [' + b", ".join(parts) + b"]")
+            elif name == "tools":
+                if tools:
+                    fields.append(b'"tools": ' + tools_json)
+            elif name in rest:
+                fields.append(f'"{name}": {json.dumps(rest[name])}'.encode())
+        return b"{" + b", ".join(fields) + b"}"
+
+
+SSE_DONE = object()
+
+def parse_sse_line(line):
+    """Parse one server-sent event line: a JSON chunk, None for lines to skip, or
+    SSE_DONE at the `[DONE]` sentinel."""
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    if not line.startswith("data:"):
+        return None  # blank separators and ": keep-alive" comments
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return SSE_DONE
+    return json.loads(data) if data else None
+
+
+class StreamAccumulator:
+    """Assembles streamed chat-completion chunks (content and tool_call deltas) back
+    into a regular non-streaming response dict."""
+    def __init__(self):
+        self.content: List[str] = []
+        self.tool_calls: Dict[int, dict] = {}
+        self.meta: dict = {}
+        self.finish_reason = None
+        self.usage = None
+
+    def feed(self, chunk: dict) -> Optional[str]:
+        if "error" in chunk:
+            raise RuntimeError(f"Stream error: {chunk['error']}")
+        for key in ("id", "model", "created"):
+            if key in chunk: self.meta[key] = chunk[key]
+        if chunk.get("usage"): self.usage = chunk["usage"]
+        if not chunk.get("choices"):
+            return None
+        choice = chunk["choices"][0]
+        if choice.get("finish_reason"): self.finish_reason = choice["finish_reason"]
+        delta = choice.get("delta") or {}
+        for tc in delta.get("tool_calls") or []:
+            slot = self.tool_calls.setdefault(tc.get("index", len(self.tool_calls)),
+                                              {"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+            if tc.get("id"): slot["id"] = tc["id"]
+            fn = tc.get("function") or {}
+            if fn.get("name"): slot["function"]["name"] += fn["name"]
+            if fn.get("arguments"): slot["function"]["arguments"] += fn["arguments"]
+        text = delta.get("content")
+        if text:
+            self.content.append(text)
+        return text
+
+    def response(self) -> dict:
+        msg = {"role": "assistant", "content": "".join(self.content) or None}
+        if self.tool_calls:
+            msg["tool_calls"] = [self.tool_calls[i] for i in sorted(self.tool_calls)]
+        elif msg["content"] is None:
+            msg["content"] = ""
+        resp = dict(self.meta, choices=[{"index": 0, "message": msg, "finish_reason": self.finish_reason}])
+        if self.usage: resp["usage"] = self.usage
+        return resp
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter that enables TCP keep-alive on pooled sockets so idle connections
+    survive the tool phase of a turn instead of being dropped by NAT/load balancers."""
+    def __init__(self, keep_alive=True, **kwargs):
+        self.keep_alive = keep_alive
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.keep_alive:
+            opts = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1), (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+            if hasattr(socket, "TCP_KEEPIDLE"):
+                opts += [(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30), (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)]
+            kwargs["socket_options"] = opts
+        super().init_poolmanager(*args, **kwargs)
+
+
+class RunTimeout(TimeoutError):
+    """A tool loop passed its `deadline`."""
+
+
+class BaseNominaLlm:
+    """Tool registration, payload construction and response handling shared by the
+    synchronous `NominaLlm` and the asyncio `AsyncNominaLlm`."""
+    tool_result_preview = 2000  # characters of a tool result included in `tool_result` events
+    retained_tool_output = 4000  # characters of a tool result kept in the caller's history
+    # Providers that only cache prompt prefixes marked with cache_control (others, e.g.
+    # OpenAI and DeepSeek, cache identical prefixes automatically).
+    cache_control_models = ("anthropic/", "google/gemini")
+    cache_breakpoints = 3  # the system prompt plus the latest messages; Anthropic allows 4
+
+    def __init__(self, api_key=None, site_url="", site_name="", default_model="openrouter/optimus-alpha",
+                 max_tool_workers=8, compactor: Optional[HistoryCompactor] = None, metrics: Optional[Metrics] = None,
+                 api_base=None, retry: Optional[RetryPolicy] = None, rate_limiter: Optional[RateLimiter] = None,
+                 router: Optional[ModelRouter] = None, fast_model: Optional[str] = None):
         self.api_key = api_key or os.getenv("OPENROUTER_API_KEY")
         self.site_url = site_url
         self.site_name = site_name
-        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
-        self.models_url = "https://openrouter.ai/api/v1/models"
+        api_base = (api_base or os.getenv("OPENROUTER_API_BASE") or "https://openrouter.ai/api/v1").rstrip("/")
+        self.base_url = f"{api_base}/chat/completions"
+        self.models_url = f"{api_base}/models"
         #self.models_url = "http://ailab.local:8181/v1/models"
         #self.base_url = "http://ailab.local:8181/v1/chat/completions"
         self.default_model = default_model
         self.tools: List[Tool] = []
         self.tool_funcs: Dict[str, Callable] = {}
+        self.parallel_tools = set()
+        self.max_tool_workers = max_tool_workers
+        self._tool_executor = None
+        self._executor_lock = threading.Lock()
+        self.compactor = compactor
+        self.last_compaction = None
+        self.metrics = metrics or Metrics()
+        self.last_turn: Optional[TurnStats] = None
+        self.retry = retry or RetryPolicy()
+        self.rate_limiter = rate_limiter or RateLimiter()  # share one instance to pool a budget
+        self.router = router  # picks the model per request and fails over; share one instance too
+        self.fast_model = fast_model  # for cheap sub-tasks such as summarising old turns
+        self.encoder = PayloadEncoder()
+        self.result_policy = ResultPolicy()  # for tools registered without their own
+        self.result_policies: Dict[str, ResultPolicy] = {}
+
+    @property
+    def tool_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._tool_executor is None:
+                self._tool_executor = ThreadPoolExecutor(max_workers=self.max_tool_workers,
+                                                         thread_name_prefix="nomina-tool")
+            return self._tool_executor
 
-    def add_tool(self, func: Callable):
+    def _shutdown_executor(self):
+        with self._executor_lock:
+            if self._tool_executor is not None:
+                self._tool_executor.shutdown(wait=False)
+                self._tool_executor = None
+
+    def add_tool(self, func: Callable, parallel: bool = False, result_policy: Optional[ResultPolicy] = None):
+        """Register `func` as a tool. Tools marked `parallel` (side-effect free reads and
+        listings) may run concurrently with each other within one assistant turn; all
+        other tools run alone and in the order the model requested them. `result_policy`
+        says how its results are capped and compacted (default: `self.result_policy`)."""
         name, desc = func.__name__, func.__doc__ or ""
         sig, props, required = inspect.signature(func), {}, []
         for pname, param in sig.parameters.items():
@@ -72,6 +251,14 @@ class NominaLlm:
         tool = Tool(function=ToolFunction(name=name, description=desc, parameters=parameters))
         self.tools.append(tool)
         self.tool_funcs[name] = func
+        if parallel:
+            self.parallel_tools.add(name)
+        else:
+            self.parallel_tools.discard(name)
+        if result_policy is not None:
+            self.result_policies[name] = result_policy
+        else:
+            self.result_policies.pop(name, None)
 
     def _build_headers(self):
         headers = {
@@ -85,51 +272,591 @@ class NominaLlm:
     def make_text_message(self, role:str, content:str) -> Message:
         return Message(role=role, content=content)
 
-    def chat(self, messages: List[Message], temperature=1.0, model=None):
+    def _payload(self, conversation, temperature, model, stream=False) -> ChatPayload:
+        # Not validated: messages may still be raw response dicts; `encoder` coerces them
+        # once each instead of on every round.
+        model = model or self.default_model
+        if self.router is not None:
+            model = self.router.route(model)[0]
+        return ChatPayload.model_construct(
+            model=model,
+            messages=self._cache_hints(conversation, model),
+            temperature=temperature,
+            tools=self.tools if self.tools else None,
+            tool_choice="auto" if self.tools else None,
+            stream=True if stream else None,
+            usage={"include": True} if "openrouter.ai" in self.base_url else None
+        )
+
+    def _cache_hints(self, conversation, model):
+        """For models in `cache_control_models`, a copy of `conversation` with cache_control
+        breakpoints on the system prompt (which, with the tool schemas ahead of it, is the
+        same for every call) and on the latest messages, so the next call reads everything
+        up to them from the cache. Other models get the conversation unchanged. The marks
+        move with the conversation: a message marked on one call goes back to plain string
+        content on the next, so only the unmarked messages keep their serialised bytes."""
+        if not self.cache_breakpoints or not model.startswith(self.cache_control_models):
+            return conversation
+        messages = list(conversation)
+        marks = [i for i, m in enumerate(messages[:1]) if as_message(m).role == "system"]
+        for i in range(len(messages) - 1, len(marks) - 1, -1):
+            if len(marks) >= self.cache_breakpoints:
+                break
+            if as_message(messages[i]).content:
+                marks.append(i)
+        for i in marks:
+            messages[i] = self._mark_cached(as_message(messages[i]))
+        return messages
+
+    @staticmethod
+    def _mark_cached(msg: Message) -> Message:
+        ephemeral = {"type": "ephemeral"}
+        if isinstance(msg.content, str):
+            parts = [MultiModalContent(type="text", text=msg.content, cache_control=ephemeral)]
+        else:
+            parts = list(msg.content)
+            parts[-1] = parts[-1].model_copy(update={"cache_control": ephemeral})
+        return msg.model_copy(update={"content": parts})
+
+    def compact(self, conversation):
+        """Run the configured compactor over `conversation`. Returns the (possibly new)
+        list and a `compaction` event reporting the tokens saved, or None. Dedup pointers
+        to results the compaction cut or dropped get the full result back."""
+        if self.compactor is None:
+            return conversation, None
+        compacted, report = self.compactor.compact(conversation)
+        self.last_compaction = report
+        if report.saved <= 0:
+            return compacted, None
+        restored = restore_pointers(conversation, compacted)
+        report.after += sum(estimate_tokens(m) for m in restored) - sum(estimate_tokens(m) for m in compacted)
+        conversation = restored
+        return conversation, {"type": "compaction", "before": report.before, "after": report.after,
+                              "saved": report.saved, "truncated": report.truncated,
+                              "collapsed": report.collapsed, "summarized": report.summarized}
+
+    def _encode(self, payload: ChatPayload, turn: TurnStats) -> bytes:
+        start = time.perf_counter()
+        body = self.encoder.encode(payload)
+        turn.serialize_seconds = time.perf_counter() - start
+        turn.bytes_sent = len(body)
+        return body
+
+    def _reserve(self, turn: TurnStats) -> float:
+        """Seconds to hold the request back for the rate limiter (prompt tokens estimated
+        from the body size)."""
+        wait = self.rate_limiter.reserve(turn.bytes_sent // 4)
+        turn.throttle_seconds += wait
+        return wait
+
+    @staticmethod
+    def _failure(exc):
+        """(status, headers) of a failed request - (None, None) for a transport error - or
+        None if retrying cannot help."""
+        if isinstance(exc, (requests.HTTPError, httpx.HTTPStatusError)) and exc.response is not None:
+            return exc.response.status_code, exc.response.headers
+        if isinstance(exc, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                            httpx.TransportError)):
+            return None, None
+        return None
+
+    def _failover(self, exc: Exception, turn: TurnStats, payload: ChatPayload) -> bool:
+        """With a router, switch `payload` to the next model not yet tried in this turn.
+        Errors about the account rather than the model are not worth failing over."""
+        self.router.record(turn.model, error=True)
+        response = getattr(exc, "response", None)
+        if response is not None and response.status_code in (401, 402, 403):
+            return False
+        fallback = next((m for m in self.router.route() if m != turn.model and m not in turn.failed_models), None)
+        if fallback is None:
+            return False  # every model has failed: retry the last one as usual
+        turn.failed_models.append(turn.model)
+        self.metrics.inc("nomina_model_failovers_total", source=turn.model, target=fallback)
+        payload.model = turn.model = fallback
+        return True
+
+    def _retry_delay(self, attempt: int, exc: Exception, turn: TurnStats, payload: ChatPayload) -> Optional[float]:
+        """Seconds to wait before repeating a failed request, or None to give up. With a
+        router the request moves to another model at once; a 429 pauses every request
+        sharing the rate limiter."""
+        self.metrics.inc("nomina_request_errors_total", model=turn.model)
+        if self.router is not None and self._failover(exc, turn, payload):
+            return 0.0
+        failure = self._failure(exc)
+        if failure is None:
+            return None
+        status, headers = failure
+        delay = self.retry.delay(attempt, status, parse_retry_after(headers))
+        if delay is None:
+            return None
+        if status == 429:
+            self.rate_limiter.pause(delay)
+        turn.retries += 1
+        self.metrics.inc("nomina_request_retries_total", model=turn.model, reason=str(status or "network"))
+        return delay
+
+    @staticmethod
+    def _retry_event(turn: TurnStats, delay: float, exc: Exception) -> dict:
+        """`partial` means tokens of the failed attempt were already streamed; the retry
+        streams the whole reply again."""
+        return {"type": "retry", "attempt": turn.retries + len(turn.failed_models), "delay": round(delay, 2),
+                "error": str(exc), "model": turn.model, "partial": turn.ttft_seconds is not None}
+
+    def _record_turn(self, turn: TurnStats, response_json: dict) -> dict:
+        usage = response_json.get("usage") or {}
+        turn.prompt_tokens = usage.get("prompt_tokens") or 0
+        turn.completion_tokens = usage.get("completion_tokens") or 0
+        details = usage.get("prompt_tokens_details") or {}
+        turn.cache_read_tokens = details.get("cached_tokens") or usage.get("cache_read_input_tokens") or 0
+        turn.cache_write_tokens = (details.get("cache_write_tokens") or usage.get("cache_creation_input_tokens")
+                                   or 0)
+        self.rate_limiter.settle(turn.bytes_sent // 4, turn.prompt_tokens + turn.completion_tokens)
+        if self.router is not None:
+            self.router.record(turn.model, turn.ttft_seconds if turn.ttft_seconds is not None else turn.http_seconds)
+        self.last_turn = turn
+        self.metrics.record_turn(turn)
+        return {"type": "turn", "stats": turn.model_dump()}
+
+    def _timed_tool(self, name, func, args):
+        start = time.perf_counter()
+        try:
+            result = func(**args)
+        except Exception:
+            self.metrics.record_tool(name, time.perf_counter() - start, error=True)
+            raise
+        self.metrics.record_tool(name, time.perf_counter() - start)
+        return result
+
+    @staticmethod
+    def _tool_call_event(call) -> dict:
+        return {"type": "tool_call", "id": call["id"], "name": call["function"]["name"],
+                "arguments": call["function"]["arguments"]}
+
+    def _tool_result_event(self, call, result, seconds, error) -> dict:
+        return {"type": "tool_result", "id": call["id"], "name": call["function"]["name"],
+                "seconds": seconds, "error": error, "result": elide(str(result), self.tool_result_preview)}
+
+    def _retain(self, messages, new):
+        """Append a finished round (assistant tool_calls and their results, or the final
+        reply) to the caller's `messages`, eliding long tool results."""
+        for msg in new:
+            msg = as_message(msg)
+            if msg.role == "tool" and isinstance(msg.content, str) and len(msg.content) > self.retained_tool_output:
+                msg = msg.model_copy(update={"content": elide(msg.content, self.retained_tool_output)})
+            messages.append(msg)
+
+    @staticmethod
+    def _check_deadline(deadline):
+        if deadline is not None and time.monotonic() > deadline:
+            raise RunTimeout("Run time limit reached")
+
+    def _deduper(self, conversation, retain_tool_turns) -> ResultDeduper:
+        """Deduplication against the tool results in `conversation` as it is now. Results
+        that `_retain` would shorten in the caller's history are never pointed at."""
+        return ResultDeduper(conversation, max_chars=self.retained_tool_output if retain_tool_turns else None)
+
+    def _tool_message(self, call, result, deduper: ResultDeduper) -> Message:
+        """The tool message for `result`, processed by the tool's `ResultPolicy`."""
+        name = call["function"]["name"]
+        policy = self.result_policies.get(name, self.result_policy)
+        text = deduper.check(render_result(result, policy), call["id"], policy)
+        self.metrics.inc("nomina_tool_result_chars_total", len(text), tool=name)
+        return Message(role="tool", content=text, tool_call_id=call["id"])
+
+    @staticmethod
+    def _parse_call(call):
+        return call["function"]["name"], json.loads(call["function"]["arguments"] or "{}")
+
+    def _tool_batches(self, tool_calls):
+        """Split a turn's tool calls into batches, in request order. Runs of consecutive
+        parallel-safe calls form one batch whose cost is the slowest call rather than the
+        sum; any other call is a barrier and forms a batch on its own."""
+        batch = []
+        for call in tool_calls:
+            if call["function"]["name"] in self.parallel_tools:
+                batch.append(call)
+                continue
+            if batch:
+                yield batch
+                batch = []
+            yield [call]
+        if batch:
+            yield batch
+
+    @property
+    def catalog(self):
+        """The model catalogue cache shared by every client of `models_url`."""
+        return get_catalog(self.models_url)
+
+    def model_info(self, model: Optional[str] = None) -> Optional[dict]:
+        """Catalogue entry (context_length, max_completion_tokens, pricing) of `model`,
+        default the current one, if the catalogue has been fetched; never fetches."""
+        return self.catalog.get(model or self.default_model)
+
+
+class NominaLlm(BaseNominaLlm):
+    def __init__(self, api_key=None, site_url="", site_name="", default_model="openrouter/optimus-alpha",
+                 pool_connections=4, pool_maxsize=16, pool_block=False, keep_alive=True,
+                 connect_timeout=10.0, read_timeout=600.0, max_tool_workers=8, compactor=None, metrics=None, api_base=None,
+                 retry=None, rate_limiter=None, router=None, fast_model=None):
+        super().__init__(api_key, site_url, site_name, default_model, max_tool_workers, compactor, metrics, api_base,
+                         retry, rate_limiter, router, fast_model)
+        self.timeout = (connect_timeout, read_timeout)
+        self.keep_alive = keep_alive
+        # One adapter (and so one urllib3 pool) shared by all threads; each thread gets
+        # its own Session on top of it since Session itself is not thread-safe.
+        self._adapter = KeepAliveAdapter(keep_alive=keep_alive, pool_connections=pool_connections,
+                                         pool_maxsize=pool_maxsize, pool_block=pool_block)
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", self._adapter)
+            session.mount("http://", self._adapter)
+            if not self.keep_alive:
+                session.headers["Connection"] = "close"
+            self._local.session = session
+        return session
+
+    def close(self):
+        """Release pooled connections and the tool thread pool."""
+        self._adapter.close()
+        self._shutdown_executor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _complete(self, payload: ChatPayload, turn: Optional[TurnStats] = None):
+        turn = turn or TurnStats(model=payload.model)
+        for attempt in itertools.count():
+            body = self._encode(payload, turn)  # again after failing over to another model
+            time.sleep(self._reserve(turn))
+            start = time.perf_counter()
+            try:
+                resp = self.session.post(self.base_url, headers=self._build_headers(), data=body, timeout=self.timeout)
+                resp.raise_for_status()
+            except requests.RequestException as e:
+                delay = self._retry_delay(attempt, e, turn, payload)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            turn.bytes_received = len(resp.content)
+            turn.http_seconds = time.perf_counter() - start
+            return resp.json()
+
+    def _complete_stream(self, payload: ChatPayload, turn: TurnStats):
+        """Yield token events as content deltas arrive (and a `retry` event before a failed
+        request is repeated); the generator's return value is the assembled response in the
+        same shape as a non-streaming completion."""
+        for attempt in itertools.count():
+            body = self._encode(payload, turn)  # again after failing over to another model
+            time.sleep(self._reserve(turn))
+            acc = StreamAccumulator()
+            start = time.perf_counter()
+            try:
+                with self.session.post(self.base_url, headers=self._build_headers(), data=body, stream=True,
+                                       timeout=self.timeout) as resp:
+                    resp.raise_for_status()
+                    for line in resp.iter_lines(chunk_size=None):
+                        turn.bytes_received += len(line) + 1
+                        chunk = parse_sse_line(line)
+                        if chunk is SSE_DONE:
+                            break
+                        delta = acc.feed(chunk) if chunk is not None else None
+                        if delta:
+                            if turn.ttft_seconds is None:
+                                turn.ttft_seconds = time.perf_counter() - start
+                            yield {"type": "token", "content": delta}
+            except requests.RequestException as e:
+                delay = self._retry_delay(attempt, e, turn, payload)
+                if delay is None:
+                    raise
+                yield self._retry_event(turn, delay, e)
+                turn.ttft_seconds = None
+                time.sleep(delay)
+                continue
+            turn.http_seconds = time.perf_counter() - start
+            return acc.response()
+
+    def _chat_events(self, messages, temperature, model, stream, retain_tool_turns=False, deadline=None):
         conversation = list(messages)
+        deduper = self._deduper(conversation, retain_tool_turns)
 
         while True:
-            payload = ChatPayload(
-                model=model or self.default_model,
-                messages=conversation,
-                temperature=temperature,
-                tools=self.tools if self.tools else None,
-                tool_choice="auto" if self.tools else None
-            )
-            resp = requests.post(self.base_url, headers=self._build_headers(),
-                                 json=payload.model_dump(exclude_none=True))
-            resp.raise_for_status()
-            response_json = resp.json()
+            conversation, event = self.compact(conversation)
+            if event:
+                deduper = self._deduper(conversation, retain_tool_turns)  # earlier results may be gone or cut
+                yield event
+            self._check_deadline(deadline)
+            payload = self._payload(conversation, temperature, model, stream)
+            turn = TurnStats(model=payload.model)
+            if stream:
+                response_json = yield from self._complete_stream(payload, turn)
+            else:
+                response_json = self._complete(payload, turn)
             msg = response_json["choices"][0]["message"]
-            tool_calls = msg.get("tool_calls", [])
+            tool_calls = msg.get("tool_calls") or []
 
             if tool_calls:
                 conversation.append(msg)
+                round_start = len(conversation) - 1
+
+                tools_start = time.perf_counter()
+                for batch in self._tool_batches(tool_calls):
+                    self._check_deadline(deadline)
+                    for call in batch:
+                        yield self._tool_call_event(call)
+                    for call, (result, seconds, error) in self._run_batch(batch):
+                        conversation.append(self._tool_message(call, result, deduper))
+                        yield self._tool_result_event(call, conversation[-1].content, seconds, error)
+                turn.tool_calls, turn.tool_seconds = len(tool_calls), time.perf_counter() - tools_start
+                if retain_tool_turns:
+                    self._retain(messages, conversation[round_start:])
+                yield self._record_turn(turn, response_json)
+            else:
+                if retain_tool_turns:
+                    self._retain(messages, [msg])
+                yield self._record_turn(turn, response_json)
+                yield {"type": "done", "response": response_json}
+                return
+
+    def _call_tool(self, call):
+        """Run one tool call; returns (result, seconds, error)."""
+        fn = call["function"]["name"]
+        start = time.perf_counter()
+        try:
+            fn, args = self._parse_call(call)
+            return self._timed_tool(fn, self.tool_funcs[fn], args), time.perf_counter() - start, False
+        except Exception as e:
+            return f"Error calling `{fn}`: {e}", time.perf_counter() - start, True
+
+    def _run_batch(self, batch):
+        """(call, outcome) pairs in request order; a batch of several parallel-safe calls
+        runs concurrently on the tool pool."""
+        if len(batch) > 1:
+            return zip(batch, self.tool_executor.map(self._call_tool, batch))
+        return [(batch[0], self._call_tool(batch[0]))]
+
+    def chat(self, messages: List[Message], temperature=1.0, model=None, on_token: Optional[Callable[[str], None]] = None,
+             retain_tool_turns=False, deadline: Optional[float] = None):
+        """Run the tool loop and return the final completion. If `on_token` is given the
+        completions are streamed and every content delta is passed to it as it arrives.
+        With `retain_tool_turns` the assistant tool calls, their (elided) results and the
+        final reply are appended to `messages`, so a follow-up question can build on them
+        instead of repeating the calls; `messages` must be a list. Past `deadline` (a
+        time.monotonic() value) no further model request or tool batch is started and
+        RunTimeout is raised; the one in flight is bounded by its own timeout."""
+        for event in self._chat_events(messages, temperature, model, on_token is not None, retain_tool_turns,
+                                       deadline):
+            if event["type"] == "token":
+                on_token(event["content"])
+            elif event["type"] == "done":
+                return event["response"]
+
+    def stream_chat(self, messages: List[Message], temperature=1.0, model=None, retain_tool_turns=False,
+                    deadline: Optional[float] = None):
+        """Streaming variant of `chat`: a generator of event dicts -
+        {"type": "token", "content"}, {"type": "tool_call", "id", "name", "arguments"} as a
+        tool starts, {"type": "tool_result", "id", "name", "seconds", "error", "result"} as it
+        finishes (result elided to `tool_result_preview` characters), {"type": "compaction",
+        "saved", ...}, {"type": "turn", "stats"} after each model round trip and finally
+        {"type": "done", "response"}. `retain_tool_turns` and `deadline` are as for `chat`;
+        each round is appended before its `turn` event."""
+        return self._chat_events(messages, temperature, model, True, retain_tool_turns, deadline)
+
+    def list_models(self, refresh: bool = False) -> List[Dict]:
+        """Available models (see `catalog.parse_models`), from the shared catalogue cache
+        unless there is no copy yet or `refresh` is set."""
+        models = None if refresh else self.catalog.cached(self._build_headers())
+        return models if models is not None else self.catalog.refresh(self._build_headers(), self.session)
+
+
+class AsyncNominaLlm(BaseNominaLlm):
+    """asyncio counterpart of `NominaLlm` built on a pooled `httpx.AsyncClient`. Tools are
+    registered the same way and may be plain functions or `async def` coroutines; plain
+    functions run on the tool thread pool so they never block the event loop."""
+    def __init__(self, api_key=None, site_url="", site_name="", default_model="openrouter/optimus-alpha",
+                 pool_maxsize=100, keepalive_connections=20, keepalive_expiry=60.0,
+                 connect_timeout=10.0, read_timeout=600.0, max_tool_workers=8, compactor=None, metrics=None, api_base=None,
+                 retry=None, rate_limiter=None, router=None, fast_model=None):
+        super().__init__(api_key, site_url, site_name, default_model, max_tool_workers, compactor, metrics, api_base,
+                         retry, rate_limiter, router, fast_model)
+        self.limits = httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=keepalive_connections,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so the client binds to the loop that actually uses it.
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+        return self._client
 
-                for call in tool_calls:
-                    fn = call["function"]["name"]
-                    args = json.loads(call["function"]["arguments"])
+    async def aclose(self):
+        """Release pooled connections and the tool thread pool."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._shutdown_executor()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def _complete(self, payload: ChatPayload, turn: Optional[TurnStats] = None):
+        turn = turn or TurnStats(model=payload.model)
+        for attempt in itertools.count():
+            body = self._encode(payload, turn)  # again after failing over to another model
+            await asyncio.sleep(self._reserve(turn))
+            start = time.perf_counter()
+            try:
+                resp = await self.client.post(self.base_url, headers=self._build_headers(), content=body)
+                resp.raise_for_status()
+            except httpx.HTTPError as e:
+                delay = self._retry_delay(attempt, e, turn, payload)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            turn.bytes_received = len(resp.content)
+            turn.http_seconds = time.perf_counter() - start
+            return resp.json()
+
+    async def _chat_events(self, messages, temperature, model, stream, retain_tool_turns=False, deadline=None):
+        conversation = list(messages)
+        deduper = self._deduper(conversation, retain_tool_turns)
+
+        while True:
+            if self.compactor is not None and self.compactor.summarizer is not None:
+                # summarizers make blocking model calls; keep them off the event loop
+                loop = asyncio.get_running_loop()
+                conversation, event = await loop.run_in_executor(self.tool_executor, self.compact, conversation)
+            else:
+                conversation, event = self.compact(conversation)
+            if event:
+                deduper = self._deduper(conversation, retain_tool_turns)  # earlier results may be gone or cut
+                yield event
+            self._check_deadline(deadline)
+            payload = self._payload(conversation, temperature, model, stream)
+            turn = TurnStats(model=payload.model)
+            if stream:
+                for attempt in itertools.count():
+                    body = self._encode(payload, turn)  # again after failing over to another model
+                    await asyncio.sleep(self._reserve(turn))
+                    acc = StreamAccumulator()
+                    start = time.perf_counter()
                     try:
-                        result = self.tool_funcs[fn](**args)
-                    except Exception as e:
-                        result = f"Error calling `{fn}`: {e}"
-
-                    conversation.append(Message(
-                        role="tool",
-                        content=str(result),
-                        tool_call_id=call["id"]
-                    ))
+                        async with self.client.stream("POST", self.base_url, headers=self._build_headers(),
+                                                      content=body) as resp:
+                            resp.raise_for_status()
+                            async for line in resp.aiter_lines():
+                                turn.bytes_received += len(line) + 1
+                                chunk = parse_sse_line(line)
+                                if chunk is SSE_DONE:
+                                    break
+                                delta = acc.feed(chunk) if chunk is not None else None
+                                if delta:
+                                    if turn.ttft_seconds is None:
+                                        turn.ttft_seconds = time.perf_counter() - start
+                                    yield {"type": "token", "content": delta}
+                    except httpx.HTTPError as e:
+                        delay = self._retry_delay(attempt, e, turn, payload)
+                        if delay is None:
+                            raise
+                        yield self._retry_event(turn, delay, e)
+                        turn.ttft_seconds = None
+                        await asyncio.sleep(delay)
+                        continue
+                    turn.http_seconds = time.perf_counter() - start
+                    response_json = acc.response()
+                    break
             else:
-                return response_json
+                response_json = await self._complete(payload, turn)
+            msg = response_json["choices"][0]["message"]
+            tool_calls = msg.get("tool_calls") or []
+
+            if tool_calls:
+                conversation.append(msg)
+                round_start = len(conversation) - 1
+
+                tools_start = time.perf_counter()
+                for batch in self._tool_batches(tool_calls):
+                    self._check_deadline(deadline)
+                    for call in batch:
+                        yield self._tool_call_event(call)
+                    for call, (result, seconds, error) in await self._run_batch(batch):
+                        conversation.append(self._tool_message(call, result, deduper))
+                        yield self._tool_result_event(call, conversation[-1].content, seconds, error)
+                turn.tool_calls, turn.tool_seconds = len(tool_calls), time.perf_counter() - tools_start
+                if retain_tool_turns:
+                    self._retain(messages, conversation[round_start:])
+                yield self._record_turn(turn, response_json)
+            else:
+                if retain_tool_turns:
+                    self._retain(messages, [msg])
+                yield self._record_turn(turn, response_json)
+                yield {"type": "done", "response": response_json}
+                return
+
+    async def _call_tool(self, call):
+        fn = call["function"]["name"]
+        start = time.perf_counter()
+        try:
+            fn, args = self._parse_call(call)
+            func = self.tool_funcs[fn]
+            if inspect.iscoroutinefunction(func):
+                try:
+                    result = await func(**args)
+                except Exception:
+                    self.metrics.record_tool(fn, time.perf_counter() - start, error=True)
+                    raise
+                self.metrics.record_tool(fn, time.perf_counter() - start)
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self.tool_executor,
+                                                    functools.partial(self._timed_tool, fn, func, args))
+            return result, time.perf_counter() - start, False
+        except Exception as e:
+            return f"Error calling `{fn}`: {e}", time.perf_counter() - start, True
+
+    async def _run_batch(self, batch):
+        return list(zip(batch, await asyncio.gather(*(self._call_tool(c) for c in batch))))
+
+    async def chat(self, messages: List[Message], temperature=1.0, model=None, on_token: Optional[Callable] = None,
+                   retain_tool_turns=False, deadline: Optional[float] = None):
+        """Run the tool loop and return the final completion. `on_token` may be a plain
+        function or a coroutine function; when given, completions are streamed.
+        `retain_tool_turns` and `deadline` are as for `NominaLlm.chat`."""
+        async for event in self._chat_events(messages, temperature, model, on_token is not None, retain_tool_turns,
+                                             deadline):
+            if event["type"] == "token":
+                result = on_token(event["content"])
+                if inspect.isawaitable(result):
+                    await result
+            elif event["type"] == "done":
+                return event["response"]
+
+    def stream_chat(self, messages: List[Message], temperature=1.0, model=None, retain_tool_turns=False,
+                    deadline: Optional[float] = None):
+        """Async generator of the same events as `NominaLlm.stream_chat`."""
+        return self._chat_events(messages, temperature, model, True, retain_tool_turns, deadline)
 
-    def list_models(self) -> List[Dict[str, str]]:
-        """Fetch list of available OpenRouter models"""
-        response = requests.get(self.models_url, headers=self._build_headers())
+    async def list_models(self, refresh: bool = False) -> List[Dict]:
+        """Async variant of `NominaLlm.list_models`."""
+        models = None if refresh else self.catalog.cached(self._build_headers())
+        if models is not None:
+            return models
+        response = await self.client.get(self.models_url, headers=self.catalog.request_headers(self._build_headers()))
         response.raise_for_status()
-        data = response.json()
-        models = []
-        for m in data.get("data", []):
-            model_id = m.get("id")
-            model_name = m.get("name") or model_id
-            models.append({"id": model_id, "name": model_name})
-        return models
+        return self.catalog.update(response.status_code, response.headers.get("ETag"),
+                                   None if response.status_code == 304 else response.json())
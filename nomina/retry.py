@@ -0,0 +1,125 @@
+"""
+Retry and rate-limit scheduling for model requests.
+
+`RetryPolicy` decides whether a failed request is worth repeating and how long to wait:
+the server's Retry-After (or rate-limit reset) when it sends one, otherwise exponential
+backoff with jitter so that many sessions failing together don't retry in lockstep.
+
+`RateLimiter` keeps a client-side requests- and tokens-per-minute budget. One instance is
+meant to be shared by every NominaLlm talking to the same account (all sessions of the API
+server); requests that would overdraw it wait their turn, and a 429 pauses all of them.
+"""
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+
+RETRY_STATUSES = frozenset({408, 409, 425, 429, 500, 502, 503, 504, 520, 522, 524, 529})
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Seconds to wait according to `retry-after-ms`, `Retry-After` (seconds or an HTTP
+    date) or `X-RateLimit-Reset` (epoch seconds or milliseconds), if any."""
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after-ms")
+        if value:
+            return max(float(value) / 1000, 0.0)
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return max(float(value), 0.0)
+            except ValueError:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        value = headers.get("x-ratelimit-reset")
+        if value:
+            reset = float(value)
+            if reset > 1e11:  # milliseconds since the epoch
+                reset /= 1000
+            return max(reset - time.time(), 0.0) if reset > 1e9 else max(reset, 0.0)
+    except (TypeError, ValueError, OverflowError):
+        pass
+    return None
+
+
+class RetryPolicy:
+    """Up to `max_attempts` tries per request. Transient failures (connection errors,
+    timeouts, the statuses in `retry_statuses`) wait `Retry-After` when given - unless it
+    exceeds `max_retry_after`, e.g. an exhausted daily quota - and otherwise
+    `base_delay * 2**attempt`, capped at `max_delay`, half of it randomised."""
+    def __init__(self, max_attempts: int = 6, base_delay: float = 1.0, max_delay: float = 60.0,
+                 max_retry_after: float = 300.0, retry_statuses=RETRY_STATUSES):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.retry_statuses = retry_statuses
+
+    def delay(self, attempt: int, status: Optional[int] = None, retry_after: Optional[float] = None) -> Optional[float]:
+        """Seconds to wait before retry number `attempt + 1`, or None to give up. `status`
+        is None for transport errors."""
+        if attempt + 1 >= self.max_attempts:
+            return None
+        if status is not None and status not in self.retry_statuses:
+            return None
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                return None
+            return retry_after + random.uniform(0, min(1.0, self.base_delay))
+        backoff = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+class RateLimiter:
+    """Requests- and tokens-per-minute budget (0 disables either). Each request reserves
+    one request and its estimated tokens up front and is told how long to wait; the
+    estimate is corrected with the reported usage afterwards. Thread-safe."""
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self.configure(rpm, tpm)
+
+    def configure(self, rpm: int = 0, tpm: int = 0):
+        with self._lock:
+            self.rpm, self.tpm = rpm, tpm
+            now = time.monotonic()
+            self._requests, self._requests_at = float(rpm), now
+            self._tokens, self._tokens_at = float(tpm), now
+
+    def _refill(self, now: float):
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + (now - self._requests_at) * self.rpm / 60)
+            self._requests_at = now
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + (now - self._tokens_at) * self.tpm / 60)
+            self._tokens_at = now
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Account for one request of about `tokens` tokens; returns the seconds to wait
+        before sending it. Budgets may go negative, which queues later requests behind it."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(self._paused_until - now, 0.0)
+            if self.rpm:
+                self._requests -= 1
+                if self._requests < 0:
+                    wait = max(wait, -self._requests * 60 / self.rpm)
+            if self.tpm:
+                self._tokens -= min(tokens, self.tpm)  # an oversized request still gets through
+                if self._tokens < 0:
+                    wait = max(wait, -self._tokens * 60 / self.tpm)
+            return wait
+
+    def settle(self, estimated: int, actual: int):
+        """Correct a reservation of `estimated` tokens with the `actual` usage."""
+        if self.tpm and actual:
+            with self._lock:
+                self._tokens -= actual - min(estimated, self.tpm)
+
+    def pause(self, seconds: float):
+        """Hold every request for `seconds` (the provider said we are over its limit)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
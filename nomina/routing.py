@@ -0,0 +1,123 @@
+"""
+Model routing: spread requests over a pool of models and route around degraded ones.
+
+`ModelRouter` keeps a rolling window of outcomes per model. A model whose recent requests
+mostly fail, or answer slower than the latency SLO, is benched for `cooldown` seconds; it
+then gets traffic again and a fresh window (a half-open circuit breaker). Like
+`RateLimiter`, one instance is meant to be shared by every client of a fleet so they all
+learn from each other's failures.
+"""
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+
+def parse_models(spec: Union[str, Sequence[str]]) -> List[Tuple[str, float]]:
+    """`"a/x:3,b/y"` or `["a/x:3", "b/y"]` -> [("a/x", 3.0), ("b/y", 1.0)]. A weight
+    must be a number after the last colon; model ids such as `x/y:free` keep their tag."""
+    items = spec.split(",") if isinstance(spec, str) else spec
+    models = []
+    for item in items:
+        item = item.strip()
+        if not item:
+            continue
+        model, sep, weight = item.rpartition(":")
+        try:
+            models.append((model, float(weight)) if sep else (item, 1.0))
+        except ValueError:
+            models.append((item, 1.0))
+    if not models:
+        raise ValueError("no models given")
+    return models
+
+
+class ModelRouter:
+    """Pool of `models` (see `parse_models`), in order of preference. With equal weights
+    each request goes to the first healthy model and fails over down the list; with
+    differing weights the first pick is random in proportion to them, among the healthy
+    ones. A request is bad if it failed or, with `latency_slo`, took longer (time to first
+    token when streaming); `error_threshold` of the last `window` requests being bad -
+    after at least `min_samples` - benches the model."""
+    def __init__(self, models, window: int = 20, min_samples: int = 3, error_threshold: float = 0.5,
+                 latency_slo: Optional[float] = None, cooldown: float = 60.0):
+        self.models = parse_models(models)
+        self.weighted = len({w for _, w in self.models}) > 1
+        self.window = window
+        self.min_samples = min_samples
+        self.error_threshold = error_threshold
+        self.latency_slo = latency_slo
+        self.cooldown = cooldown
+        self._samples: Dict[str, deque] = {}  # model -> (bad, seconds)
+        self._benched_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def route(self, preferred: Optional[str] = None) -> List[str]:
+        """Models to try for one request, best first; benched models come last rather
+        than not at all. A `preferred` model outside the pool goes first with the pool
+        as its fallbacks; inside an unweighted pool it is moved to the front unless benched."""
+        now = time.monotonic()
+        with self._lock:
+            healthy = [(m, w) for m, w in self.models if self._benched_until.get(m, 0) <= now]
+            benched = [m for m, _ in self.models if self._benched_until.get(m, 0) > now]
+        order = [m for m, _ in healthy]
+        pool = {m for m, _ in self.models}
+        if preferred and (preferred not in pool or (preferred in order and not self.weighted)):
+            order = [preferred] + [m for m in order if m != preferred]
+        elif self.weighted and any(w > 0 for _, w in healthy):
+            first = random.choices([m for m, _ in healthy], [w for _, w in healthy])[0]
+            order = [first] + [m for m in order if m != first]
+        return order + [m for m in benched if m not in order]
+
+    def record(self, model: str, seconds: Optional[float] = None, error: bool = False):
+        """Outcome of one request to `model` (`seconds`: its latency, if it succeeded)."""
+        bad = error or (self.latency_slo is not None and seconds is not None and seconds > self.latency_slo)
+        with self._lock:
+            samples = self._samples.get(model)
+            if samples is None:
+                samples = self._samples[model] = deque(maxlen=self.window)
+            samples.append((bad, seconds))
+            if len(samples) >= self.min_samples and sum(b for b, _ in samples) >= self.error_threshold * len(samples):
+                self._benched_until[model] = time.monotonic() + self.cooldown
+                samples.clear()
+
+    def healthy(self, model: str) -> bool:
+        with self._lock:
+            return self._benched_until.get(model, 0) <= time.monotonic()
+
+    def stats(self) -> Dict[str, dict]:
+        """Per model: requests and share of bad ones in the window, median latency, and
+        the seconds it stays benched."""
+        now = time.monotonic()
+        result = {}
+        with self._lock:
+            for model in dict.fromkeys([m for m, _ in self.models] + list(self._samples)):
+                samples = list(self._samples.get(model, ()))
+                latencies = [s for bad, s in samples if s is not None]
+                result[model] = {"requests": len(samples),
+                                 "bad_rate": sum(b for b, _ in samples) / len(samples) if samples else 0.0,
+                                 "p50_seconds": statistics.median(latencies) if latencies else None,
+                                 "benched_seconds": max(self._benched_until.get(model, 0) - now, 0.0)}
+        return result
+
+
+def add_routing_arguments(parser, default_model: str):
+    group = parser.add_argument_group("models")
+    group.add_argument("--model", "-m", default=default_model,
+                       help="Model, or a comma-separated pool to fail over through in order; MODEL:WEIGHT spreads "
+                            "requests by weight")
+    group.add_argument("--fast-model", help="Model for cheap sub-tasks such as summarising older turns")
+    group.add_argument("--latency-slo", type=float,
+                       help="Seconds (to the first token when streaming) beyond which a response counts against a model")
+    group.add_argument("--failover-cooldown", type=float, default=60.0, help="Seconds a degraded model is skipped")
+    return group
+
+
+def router_from_args(args) -> Tuple[str, Optional[ModelRouter]]:
+    """The default model and, for a pool of several, the router."""
+    models = parse_models(args.model)
+    if len(models) < 2:
+        return models[0][0], None
+    return models[0][0], ModelRouter(args.model, latency_slo=args.latency_slo, cooldown=args.failover_cooldown)
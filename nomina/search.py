@@ -0,0 +1,336 @@
+"""
+Code search over the working directory backed by an incrementally maintained trigram index.
+
+Each indexed file contributes the trigrams of its (lower-cased) word tokens, so a query
+only has to open the files that contain every trigram of its literal word runs. The index
+is refreshed lazily: a full stat pass when it is older than `refresh_interval` or after a
+shell command, and per path when a tool writes or deletes a file. After a shell command
+the next search waits for the pass; when the index is merely old it keeps answering while
+the pass runs in the background. It is pickled under ~/.cache/nomina so a restart only
+re-reads files that changed.
+"""
+import hashlib
+import os
+import pickle
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from .fileops import glob_matcher, walk_files
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+INDEX_VERSION = 1
+MAX_INDEXED_SIZE = 1 << 20  # larger files are not indexed, only scanned
+BINARY_SNIFF = 8192
+UNINDEXED, SKIPPED = -1, -2  # file ids of large (scanned) and binary (ignored) files
+_WORDS = re.compile(rb"\w{3,}")
+
+
+def cache_dir() -> str:
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "nomina")
+
+
+def _trigrams(data: bytes) -> Set[bytes]:
+    grams = set()
+    for word in set(_WORDS.findall(data.lower())):
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def required_literals(query: str, regex: bool) -> List[str]:
+    """Literal strings every match must contain: the query itself, or the runs of plain
+    characters in a regex's top-level sequence (anything else - classes, repeats,
+    alternation - breaks a run, which keeps this conservative)."""
+    if not regex:
+        return [query]
+    try:
+        parsed = sre_parse.parse(query)
+    except re.error:
+        return []
+    runs, current = [], []
+    for op, arg in parsed:
+        if op is sre_parse.LITERAL:
+            current.append(chr(arg))
+        else:
+            if current:
+                runs.append("".join(current))
+            current = []
+    if current:
+        runs.append("".join(current))
+    return runs
+
+
+class SearchMatch(BaseModel):
+    path: str
+    line: int
+    text: str
+
+
+class SearchResult(BaseModel):
+    query: str
+    matches: List[SearchMatch]
+    files_scanned: int
+    files_total: int
+    truncated: bool = False
+
+    def render(self) -> str:
+        if not self.matches:
+            return f"No matches for {self.query!r} ({self.files_scanned} of {self.files_total} files scanned)"
+        files = len({m.path for m in self.matches})
+        lines = [f"{len(self.matches)} matches in {files} files for {self.query!r} "
+                 f"({self.files_scanned} of {self.files_total} files scanned):"]
+        lines += [f"{m.path}:{m.line}: {m.text}" for m in self.matches]
+        if self.truncated:
+            lines.append("[more matches not shown; narrow the query or add a glob]")
+        return "\n".join(lines)
+
+
+class TrigramIndex:
+    """Trigram index of the files under `root`. Thread-safe; shared by every tool bound
+    to the same directory (see `get_index`)."""
+    def __init__(self, root: str, refresh_interval: float = 30.0, index_path: Optional[str] = "auto"):
+        self.root = os.path.realpath(root)
+        self.refresh_interval = refresh_interval
+        if index_path == "auto":
+            digest = hashlib.sha1(self.root.encode()).hexdigest()[:16]
+            index_path = os.path.join(cache_dir(), f"index-{digest}.pickle")
+        self.index_path = index_path
+        self.files: Dict[str, Tuple[int, int, int]] = {}  # path -> (file id, mtime_ns, size); id < 0: not indexed
+        self.paths: Dict[int, str] = {}  # live file id -> path
+        self.postings: Dict[bytes, array] = {}  # trigram -> ascending file ids (may include dead ones)
+        self.unindexed: Set[str] = set()  # too large to index, always scanned
+        self.next_id = 0
+        self.dead = 0
+        self.loaded = False
+        self.last_refresh = 0.0
+        self.stale = True
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()  # one stat pass at a time
+
+    def _remove(self, path: str):
+        entry = self.files.pop(path, None)
+        if entry is not None and entry[0] >= 0:
+            del self.paths[entry[0]]
+            self.dead += 1
+        self.unindexed.discard(path)
+
+    def _add(self, path: str, mtime_ns: int, size: int) -> bool:
+        """(Re)index one file; False if it is unreadable."""
+        self._remove(path)
+        full = os.path.join(self.root, path)
+        try:
+            with open(full, "rb") as f:
+                head = f.read(BINARY_SNIFF)
+                if b"\0" in head:
+                    self.files[path] = (SKIPPED, mtime_ns, size)  # binary, never searched
+                    return True
+                if size > MAX_INDEXED_SIZE:
+                    self.unindexed.add(path)
+                    self.files[path] = (UNINDEXED, mtime_ns, size)
+                    return True
+                data = head + f.read()
+        except OSError:
+            return False
+        file_id = self.next_id
+        self.next_id += 1
+        self.files[path] = (file_id, mtime_ns, size)
+        self.paths[file_id] = path
+        postings = self.postings
+        for gram in _trigrams(data):
+            ids = postings.get(gram)
+            if ids is None:
+                postings[gram] = array("I", (file_id,))
+            else:
+                ids.append(file_id)
+        return True
+
+    def _compact(self):
+        live = self.paths
+        for gram in list(self.postings):
+            ids = array("I", (i for i in self.postings[gram] if i in live))
+            if ids:
+                self.postings[gram] = ids
+            else:
+                del self.postings[gram]
+        self.dead = 0
+
+    def _load(self):
+        self.loaded = True
+        if not self.index_path:
+            return
+        try:
+            with open(self.index_path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            return
+        if state.get("version") != INDEX_VERSION or state.get("root") != self.root:
+            return
+        for key in ("files", "paths", "postings", "unindexed", "next_id", "dead"):
+            setattr(self, key, state[key])
+
+    def save(self):
+        if not self.index_path:
+            return
+        with self._lock:
+            state = {"version": INDEX_VERSION, "root": self.root, "files": self.files, "paths": self.paths,
+                     "postings": self.postings, "unindexed": self.unindexed, "next_id": self.next_id,
+                     "dead": self.dead}
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            tmp = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.index_path)
+
+    @property
+    def due(self) -> bool:
+        return self.stale or time.monotonic() - self.last_refresh >= self.refresh_interval
+
+    def refresh(self, force: bool = False, wait: bool = True) -> int:
+        """Stat every file and reindex the ones that changed; returns how many did. The
+        stat pass runs without the index lock, so searches are not held up by it; without
+        `wait`, returns 0 at once if another refresh is running."""
+        if not self._refresh_lock.acquire(blocking=wait):
+            return 0
+        try:
+            with self._lock:
+                if not self.loaded:
+                    self._load()
+                if not force and not self.due:
+                    return 0
+                self.stale = False  # a change from here on calls for another pass
+                known = dict(self.files)
+            changed, seen = [], set()
+            for path, entry in walk_files(self.root):
+                seen.add(path)
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                old = known.get(path)
+                if old is None or old[1] != st.st_mtime_ns or old[2] != st.st_size:
+                    changed.append((path, st.st_mtime_ns, st.st_size))
+            gone = [path for path in known if path not in seen]
+            with self._lock:
+                for path, mtime_ns, size in changed:
+                    self._add(path, mtime_ns, size)
+                for path in gone:
+                    if not os.path.lexists(os.path.join(self.root, path)):  # a tool may have re-created it
+                        self._remove(path)
+                if self.dead > max(1000, len(self.paths) // 2):
+                    self._compact()
+                self.last_refresh = time.monotonic()
+                if changed or gone:
+                    self.save()
+            return len(changed) + len(gone)
+        finally:
+            self._refresh_lock.release()
+
+    def refresh_in_background(self):
+        if not self._refresh_lock.locked():
+            threading.Thread(target=self.refresh, kwargs={"wait": False}, daemon=True, name="nomina-index").start()
+
+    def mark_stale(self):
+        """Something outside the file tools (e.g. a shell command) may have changed files."""
+        self.stale = True
+
+    def notify(self, path: str):
+        """A tool wrote or deleted `path` (relative to root or absolute)."""
+        if not self._lock.acquire(blocking=False):
+            self.stale = True  # a refresh is running; don't make the tool wait for it
+            return
+        try:
+            if not self.loaded:
+                return  # picked up by the first refresh
+            rel = os.path.relpath(os.path.realpath(os.path.join(self.root, path)), self.root).replace(os.sep, "/")
+            try:
+                st = os.stat(os.path.join(self.root, rel))
+            except OSError:
+                self._remove(rel)
+                return
+            self._add(rel, st.st_mtime_ns, st.st_size)
+        finally:
+            self._lock.release()
+
+    def _candidates(self, literals: List[str]) -> Tuple[List[str], int]:
+        grams = set()
+        for literal in literals:
+            grams |= _trigrams(literal.encode())
+        with self._lock:
+            total = len(self.files)
+            unindexed = sorted(self.unindexed)
+            if not grams:
+                return sorted(p for p, (i, _, _) in self.files.items() if i >= 0) + unindexed, total
+            lists = sorted((self.postings.get(g, array("I")) for g in grams), key=len)
+            ids = [i for i in lists[0] if i in self.paths]
+            for other in lists[1:]:
+                ids = [i for i in ids if (k := bisect_left(other, i)) < len(other) and other[k] == i]
+                if not ids:
+                    break
+            return sorted(self.paths[i] for i in ids) + unindexed, total
+
+    def search(self, query: str, regex: bool = False, case_sensitive: bool = False, glob: Optional[str] = None,
+               max_results: int = 100, max_line: int = 200) -> SearchResult:
+        flags = re.MULTILINE | (0 if case_sensitive else re.IGNORECASE)
+        pattern = re.compile(query if regex else re.escape(query), flags)
+        if self.stale or not self.last_refresh:
+            self.refresh()  # files may have changed outside the tools, or nothing is indexed yet
+        elif self.due:
+            self.refresh_in_background()
+        candidates, total = self._candidates(required_literals(query, regex))
+        if glob:
+            match = glob_matcher(glob)
+            candidates = [p for p in candidates if match(p)]
+        matches, scanned, truncated = [], 0, False
+        for path in candidates:
+            try:
+                with open(os.path.join(self.root, path), "rb") as f:
+                    text = f.read().decode("utf-8", errors="replace")
+            except OSError:
+                continue
+            scanned += 1
+            line, pos, last_line = 1, 0, 0
+            for m in pattern.finditer(text):
+                line += text.count("\n", pos, m.start())
+                pos = m.start()
+                if line == last_line:
+                    continue
+                last_line = line
+                start = text.rfind("\n", 0, pos) + 1
+                end = text.find("\n", pos)
+                snippet = text[start:end if end >= 0 else len(text)].strip()
+                matches.append(SearchMatch(path=path, line=line, text=snippet[:max_line]))
+                if len(matches) >= max_results:
+                    truncated = True
+                    break
+            if truncated:
+                break
+        return SearchResult(query=query, matches=matches, files_scanned=scanned, files_total=total, truncated=truncated)
+
+
+_indexes: Dict[str, TrigramIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(root: str) -> TrigramIndex:
+    """The shared index for `root`; built lazily by its first search."""
+    root = os.path.realpath(root)
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = TrigramIndex(root)
+        return index
+
+
+def parse_flag(value) -> bool:
+    """Boolean tool argument (tool arguments arrive as strings)."""
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
@@ -1,21 +1,47 @@
 """
 Flask API server for Nomina
 """
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS  # Import CORS from flask_cors
 import os
-import subprocess
 import traceback
 import argparse
-from nomina.nominallm import NominaLlm
+import json
+import queue
+import threading
+import time
+import uuid
+from nomina.nominallm import NominaLlm, RunTimeout
+from nomina.compaction import HistoryCompactor, make_summarizer
+from nomina.metrics import Metrics
+from nomina.retry import RateLimiter
+from nomina.routing import add_routing_arguments, router_from_args
+from nomina.toolresults import SHELL_POLICY
+from nomina.filecache import FileCache
+from nomina.edits import apply_edit as apply_file_edit
+from nomina.shell import run_shell, parse_cpu_limit, parse_timeout
+from nomina.search import get_index, parse_flag
+from nomina.fileops import (read_chunk, list_tree as list_tree_entries, read_files as read_batch,
+                            write_files as write_batch, parse_paths, parse_files, DEFAULT_MAX_BYTES, DEFAULT_MAX_ENTRIES)
+from nomina.store import ConversationLog, data_dir, log_name, root_dir
+from nomina.serving import RunLimiter, add_serving_arguments, configure_limiter, serve
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
 # Initialize global variables - will be set in main()
 working_dir = None
-llm = None
-history = None
+default_model = "openrouter/optimus-alpha"
+sessions = None
+llm_options = {}  # extra NominaLlm keyword arguments for every session (api_base, api_key, ...)
+metrics = Metrics()  # shared by all sessions so counters stay monotonic
+rate_limiter = RateLimiter()  # one requests/tokens-per-minute budget for all sessions
+router = None  # ModelRouter shared by all sessions when --model names a pool
+fast_model = None  # summarises older turns when the history is compacted
+file_cache = FileCache(metrics=metrics)  # file contents shared by read_file and /api/files/content
+run_limiter = RunLimiter()  # caps concurrent agent runs; configured from the serving arguments
+sse_heartbeat = 15  # seconds between keep-alive comments on idle event streams
+shell_cpu_limit = None  # CPU seconds per shell command (ulimit -t); None: unlimited
 system_prompt = """
 You are Nomina, an autonomous coding and shell assistant.
 
@@ -23,6 +49,7 @@ You are Nomina, an autonomous coding and shell assistant.
 - When asked to add new features, do the following:
     1. Read relevant files.
     2. Modify and save files using tools.
+    - Prefer apply_edit for changes to existing files; use write_file for new files or full rewrites.
     - Repeat steps 1-2 until confident it works.
 - Avoid repeated narration; take action instead.
 - Always report your **final status** succinctly.
@@ -30,214 +57,663 @@ You are Nomina, an autonomous coding and shell assistant.
 """
 
 # Safety function for paths
-def safe_path(path):
-    jail_dir = working_dir
+def safe_path(path, root=None):
+    jail_dir = os.path.realpath(root or working_dir)
     abs_path = os.path.abspath(os.path.join(jail_dir, path))
-    if not abs_path.startswith(jail_dir):
+    if os.path.commonpath([jail_dir, os.path.realpath(abs_path)]) != jail_dir:
         raise Exception(f"Access outside jail is denied: {abs_path}")
     return abs_path
 
-# Tool functions - copied from nomina.py to maintain consistency
-def write_file(filepath, content):
-    try:
-        full_path = safe_path(filepath)
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
-        with open(full_path, "w") as f:
-            f.write(content)
-        return f"File written successfully: {filepath}"
-    except Exception as e:
-        raise RuntimeError(f"write_file failed: {e}")
+def edit_file(root, filepath, edit):
+    full_path = safe_path(filepath, root)
+    result = apply_file_edit(full_path, edit, filepath)
+    file_cache.invalidate(full_path)
+    get_index(root).notify(full_path)
+    return result
 
-def read_file(filepath):
-    try:
-        full = safe_path(filepath)
-        with open(full) as f:
-            content = f.read()
-        return content
-    except Exception as e:
-        raise RuntimeError(f"read_file failed: {e}")
+def read_many(root, paths, max_bytes=DEFAULT_MAX_BYTES):
+    return read_batch(paths, lambda path: safe_path(path, root), max_bytes=max_bytes, cache=file_cache)
 
-def list_files(directory):
-    try:
-        full_path = safe_path(directory)
-        entries = os.listdir(full_path)
-        lines = []
-        for entry in entries:
-            entry_path = os.path.join(full_path, entry)
-            if os.path.isdir(entry_path):
-                lines.append(entry + "/")
-            else:
-                lines.append(entry)
-        output = "The directory contains:\n" + "\n".join(sorted(lines))
-        return output
-    except Exception as e:
-        raise RuntimeError(f"list_files failed: {e}")
+def write_many(root, files):
+    def written(full_path):
+        file_cache.invalidate(full_path)
+        get_index(root).notify(full_path)
+    return write_batch(files, lambda path: safe_path(path, root), on_written=written)
 
-def delete_file(filepath):
-    try:
-        full_path = safe_path(filepath)
-        os.remove(full_path)
-        return f"File deleted: {filepath}"
-    except Exception as e:
-        raise RuntimeError(f"delete_file failed: {e}")
+# Tool functions - copied from nomina.py to maintain consistency, jailed to `root`.
+# `on_output(command, stream, text)` receives shell output as it is produced.
+def make_tools(root, on_output=None):
+    def write_file(filepath, content):
+        try:
+            full_path = safe_path(filepath, root)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "w") as f:
+                f.write(content)
+            file_cache.invalidate(full_path)
+            get_index(root).notify(full_path)
+            return f"File written successfully: {filepath}"
+        except Exception as e:
+            raise RuntimeError(f"write_file failed: {e}")
 
-def create_directory(directory):
-    try:
-        full_path = safe_path(directory)
-        os.makedirs(full_path, exist_ok=True)
-        return f"Directory created: {directory}"
-    except Exception as e:
-        raise RuntimeError(f"create_directory failed: {e}")
+    def apply_edit(filepath, edit):
+        """Change part of a file instead of rewriting it. `edit` is one or more blocks of
+        <<<<<<< SEARCH
+        exact existing lines
+        =======
+        replacement lines
+        >>>>>>> REPLACE
+        (each SEARCH must match exactly once; an empty SEARCH creates a new file) or a unified
+        diff with @@ hunks. All edits apply together or not at all."""
+        try:
+            return edit_file(root, filepath, edit).render()
+        except Exception as e:
+            raise RuntimeError(f"apply_edit failed: {e}")
 
-def remove_directory(directory):
-    try:
-        full_path = safe_path(directory)
-        os.rmdir(full_path)
-        return f"Directory removed: {directory}"
-    except Exception as e:
-        raise RuntimeError(f"remove_directory failed: {e}")
+    def read_file(filepath, lines=None, byte_range=None, continuation=None):
+        """Read a text file, at most 100 kB per call. Optional `lines` ("120-200") or
+        `byte_range` ("0-4096") select part of it; a partial read ends with a footer giving the
+        range and, if more follows, a `continuation` to pass back for the next chunk."""
+        try:
+            return read_chunk(safe_path(filepath, root), filepath, lines, byte_range, continuation,
+                              cache=file_cache).render()
+        except Exception as e:
+            raise RuntimeError(f"read_file failed: {e}")
 
-def shell_command(command):
-    try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True, cwd=working_dir)
-        return {
-            "stdout": result.stdout, 
-            "stderr": result.stderr, 
-            "returncode": result.returncode
-        }
-    except Exception as e:
-        raise RuntimeError(f"shell_command failed: {e}")
-
-# Initialize LLM and add tools
-def initialize_llm(model="openrouter/optimus-alpha"):
-    global llm, history, system_prompt
-    
-    llm = NominaLlm(default_model=model)
-    
+    def read_files(filepaths):
+        """Read several text files in one call. `filepaths` is a JSON array of paths (or one
+        path per line). The 100 kB budget is shared between the files; a capped file ends with
+        a `continuation` footer for read_file."""
+        try:
+            return read_many(root, parse_paths(filepaths)).render()
+        except Exception as e:
+            raise RuntimeError(f"read_files failed: {e}")
+
+    def write_files(files):
+        """Write several files in one call. `files` is a JSON object mapping each path to its
+        full content. Each file is written atomically; the result lists every file's status."""
+        try:
+            return write_many(root, parse_files(files)).render()
+        except Exception as e:
+            raise RuntimeError(f"write_files failed: {e}")
+
+    def list_files(directory):
+        try:
+            with os.scandir(safe_path(directory, root)) as it:
+                lines = [entry.name + "/" if entry.is_dir() else entry.name for entry in it]
+            return "The directory contains:\n" + "\n".join(sorted(lines))
+        except Exception as e:
+            raise RuntimeError(f"list_files failed: {e}")
+
+    def list_tree(directory=".", depth="3", pattern=None, max_entries=str(DEFAULT_MAX_ENTRIES)):
+        """Recursively list `directory` with sizes and modification times, `depth` levels deep,
+        skipping .git, node_modules and .gitignore'd paths. `pattern` ("*.py", "src/**/test_*.py")
+        keeps only matching files. Use this to map a project in one call."""
+        try:
+            return list_tree_entries(safe_path(directory, root), directory, int(depth), pattern or None,
+                                     int(max_entries), root=root).render()
+        except Exception as e:
+            raise RuntimeError(f"list_tree failed: {e}")
+
+    def delete_file(filepath):
+        try:
+            full_path = safe_path(filepath, root)
+            os.remove(full_path)
+            file_cache.invalidate(full_path)
+            get_index(root).notify(full_path)
+            return f"File deleted: {filepath}"
+        except Exception as e:
+            raise RuntimeError(f"delete_file failed: {e}")
+
+    def create_directory(directory):
+        try:
+            full_path = safe_path(directory, root)
+            os.makedirs(full_path, exist_ok=True)
+            return f"Directory created: {directory}"
+        except Exception as e:
+            raise RuntimeError(f"create_directory failed: {e}")
+
+    def remove_directory(directory):
+        try:
+            full_path = safe_path(directory, root)
+            os.rmdir(full_path)
+            get_index(root).mark_stale()
+            return f"Directory removed: {directory}"
+        except Exception as e:
+            raise RuntimeError(f"remove_directory failed: {e}")
+
+    def shell_command(command, timeout=None):
+        """Run a shell command in the working directory. `timeout` is in seconds (default 120,
+        max 1800); the process group is killed when it expires. Long output keeps its start and end."""
+        try:
+            forward = (lambda stream, text: on_output(command, stream, text)) if on_output else None
+            result = run_shell(command, cwd=root, timeout=parse_timeout(timeout), cpu_limit=shell_cpu_limit,
+                               on_output=forward)
+            get_index(root).mark_stale()
+            return result
+        except Exception as e:
+            raise RuntimeError(f"shell_command failed: {e}")
+
+    def search_files(query, regex="false", glob=None, case_sensitive="false", max_results="100"):
+        """Search file contents in the working directory (indexed, much faster than grep via
+        shell_command). `query` is a substring, or a Python regex with regex="true"; `glob`
+        ("*.py", "src/**/*.ts") limits the files. Returns path:line: text for each match."""
+        try:
+            return get_index(root).search(query, regex=parse_flag(regex), case_sensitive=parse_flag(case_sensitive),
+                                          glob=glob or None, max_results=int(max_results)).render()
+        except Exception as e:
+            raise RuntimeError(f"search_files failed: {e}")
+
+    return {f.__name__: f for f in (write_file, write_files, apply_edit, read_file, read_files, list_files, list_tree, search_files, delete_file,
+                                    create_directory, remove_directory, shell_command)}
+
+PARALLEL_TOOLS = {"read_file", "read_files", "list_files", "list_tree", "search_files"}
+RESULT_POLICIES = {"shell_command": SHELL_POLICY}  # other tools use the client's default ResultPolicy
+MAX_CONTENT_BYTES = 16 * 1024 * 1024  # largest page /api/files/content returns
+
+def build_system_prompt(root):
+    prompt = system_prompt
     # Append contents of nomina-rules.txt if it exists
-    rules_path = os.path.join(working_dir, 'nomina-rules.txt')
+    rules_path = os.path.join(root, 'nomina-rules.txt')
     if os.path.isfile(rules_path):
         with open(rules_path, 'r') as f:
-            rules = f.read()
-            system_prompt += "\n" + rules
-    
-    # Initialize chat history
-    history = [llm.make_text_message("system", system_prompt)]
-    
-    # Add tools to LLM
-    llm.add_tool(write_file)
-    llm.add_tool(read_file)
-    llm.add_tool(list_files)
-    llm.add_tool(delete_file)
-    llm.add_tool(create_directory)
-    llm.add_tool(remove_directory)
-    llm.add_tool(shell_command)
+            prompt += "\n" + f.read()
+    return prompt
+
+
+class SessionLimitError(Exception):
+    pass
+
+
+class Session:
+    """One conversation: its own history, model, working directory and NominaLlm.
+    `lock` serialises agent runs within the session; sessions run concurrently.
+    With a `log` (ConversationLog) the history is persisted and resumed from it."""
+    def __init__(self, session_id, root, model, log=None):
+        self.id = session_id
+        self.working_dir = root
+        self.lock = threading.Lock()
+        self.users = 0  # requests and runs holding the session (see SessionStore.get/release)
+        self.created = self.last_used = time.time()
+        self.llm = None
+        self.log = None
+        self.output_listener = None  # set while a streamed chat wants live shell output
+        self.reset(model)
+        self.log = log
+        if log is not None:
+            self.log_start, messages = log.tail()  # older messages are paged from the log
+            self.history += messages
+
+    def reset(self, model=None):
+        model = model or self.llm.default_model
+        if self.llm is not None:
+            self.llm.close()
+        self.llm = NominaLlm(default_model=model, compactor=HistoryCompactor(), metrics=metrics,
+                             rate_limiter=rate_limiter, router=router, fast_model=fast_model, **llm_options)
+        if fast_model:
+            self.llm.compactor.summarizer = make_summarizer(self.llm)
+        self.tools = make_tools(self.working_dir, on_output=self.emit_output)
+        for name, func in self.tools.items():
+            self.llm.add_tool(func, parallel=name in PARALLEL_TOOLS, result_policy=RESULT_POLICIES.get(name))
+        self.clear_history()
+
+    def clear_history(self):
+        """Drop everything but the system prompt; a logged conversation is archived."""
+        self.history = [self.llm.make_text_message("system", build_system_prompt(self.working_dir))]
+        self.log_start = 0  # logged messages before history[1]
+        if self.log is not None and not self.log.closed:
+            self.log.archive()
+
+    def persist(self):
+        """Log the messages added since the last call."""
+        if self.log is not None and not self.log.closed:
+            self.log.update(self.history, skipped=self.log_start)
+
+    def close(self):
+        self.llm.close()
+        if self.log is not None:
+            self.log.close()
+
+    def emit_output(self, command, stream, text):
+        listener = self.output_listener
+        if listener is not None:
+            listener(command, stream, text)
+
+    def touch(self):
+        self.last_used = time.time()
+
+    @property
+    def busy(self):
+        return self.users > 0 or self.lock.locked()
+
+    def info(self):
+        return {"session_id": self.id, "working_directory": self.working_dir, "model": self.llm.default_model,
+                "messages": self.log_start + len(self.history) - 1, "busy": self.busy,
+                "created": self.created, "last_used": self.last_used}
+
+
+class SessionStore:
+    """In-memory sessions with idle eviction and a cap on their number. When full, the
+    least recently used idle session is evicted; if every session is busy the new one
+    is refused. A session handed out by `get` is busy, and never evicted, until each
+    holder has called `release`."""
+    def __init__(self, root, model, max_sessions=64, idle_timeout=3600, history_dir=None):
+        self.root = root
+        self.model = model
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.history_dir = history_dir  # conversation logs; evicted sessions resume from them
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _evict(self, session):
+        del self._sessions[session.id]
+        session.close()
+
+    def _evict_idle(self):
+        cutoff = time.time() - self.idle_timeout
+        for session in list(self._sessions.values()):
+            if session.last_used < cutoff and not session.busy:
+                self._evict(session)
+
+    def get(self, session_id, working_dir=None, model=None, create=True):
+        with self._lock:
+            self._evict_idle()
+            session = self._sessions.get(session_id)
+            if session is None:
+                if not create:
+                    return None
+                if len(self._sessions) >= self.max_sessions:
+                    idle = [s for s in self._sessions.values() if not s.busy]
+                    if not idle:
+                        raise SessionLimitError(f"Session limit reached ({self.max_sessions})")
+                    self._evict(min(idle, key=lambda s: s.last_used))
+                try:
+                    root = safe_path(working_dir, self.root) if working_dir else self.root
+                except Exception as e:
+                    raise ValueError(str(e))
+                if not os.path.isdir(root):
+                    raise ValueError(f"Not a directory: {working_dir}")
+                log = self.open_log(session_id)
+                session = self._sessions[session_id] = Session(session_id, root, model or self.model, log)
+            session.users += 1
+            session.touch()
+            return session
+
+    def hold(self, session):
+        """Another holder of a session already handed out (e.g. a run on its own thread)."""
+        with self._lock:
+            session.users += 1
+
+    def release(self, session):
+        with self._lock:
+            session.users -= 1
+            session.touch()
+
+    def open_log(self, session_id, create=True):
+        """The conversation log of `session_id`, or None without a history dir (or, unless
+        `create`, when the session has never been logged)."""
+        if not self.history_dir:
+            return None
+        directory, name = root_dir(self.history_dir, self.root), log_name(session_id)
+        if not create and not os.path.exists(os.path.join(directory, name + ".jsonl")):
+            return None
+        return ConversationLog(directory, name)
+
+    def delete(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            if session.log is not None:
+                session.log.archive()  # a closed session's id starts a new conversation
+            self._evict(session)
+            return True
+
+    def list(self):
+        with self._lock:
+            self._evict_idle()
+            return [s.info() for s in self._sessions.values()]
+
+
+def configure(root, model="openrouter/optimus-alpha", max_sessions=64, idle_timeout=3600, history_dir=None):
+    global working_dir, default_model, sessions
+    working_dir = root
+    default_model = model
+    sessions = SessionStore(root, model, max_sessions=max_sessions, idle_timeout=idle_timeout,
+                            history_dir=history_dir)
+
+def request_session_id():
+    data = request.get_json(silent=True) or {}
+    return (data.get('session_id') or request.args.get('session_id')
+            or request.headers.get('X-Session-Id') or "default")
+
+def current_session(create=True, session_id=None):
+    """The session addressed by the request (`session_id` in the JSON body or query
+    string, or the X-Session-Id header); new sessions may pick a `working_dir`. It is
+    held until the response has been sent (see `release_sessions`)."""
+    data = request.get_json(silent=True) or {}
+    session = sessions.get(session_id or request_session_id(), working_dir=data.get('working_dir'),
+                           model=data.get('model'), create=create)
+    if session is not None:
+        g.setdefault("sessions", []).append(session)
+    return session
+
+@app.after_request
+def release_sessions(response):
+    held = g.pop("sessions", [])
+    if held:
+        # after the body is sent: a streamed response still needs its session
+        response.call_on_close(lambda: [sessions.release(s) for s in held])
+    return response
+
+@app.errorhandler(SessionLimitError)
+def session_limit(e):
+    return jsonify({"success": False, "error": str(e)}), 503, {"Retry-After": "30"}
+
+def server_busy():
+    return jsonify({"success": False, "error": "Server busy, retry later"}), 503, {"Retry-After": "5"}
+
+def reply_text(response):
+    return response.get("choices", [{}])[0].get("message", {}).get("content", "")
 
 # API Routes
 @app.route('/api/chat', methods=['POST'])
 def chat():
-    global history
-    
+    return run_chat(stream=False)
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    return run_chat(stream=True)
+
+def run_chat(stream):
     data = request.json
     if not data or 'message' not in data:
         return jsonify({"error": "Message is required"}), 400
-    
+
+    try:
+        session = current_session()
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     message = data['message']
-    history.append(llm.make_text_message("user", message))
-    
+
+    if not run_limiter.acquire():
+        return server_busy()
+
+    if stream or data.get('stream'):
+        response = Response(stream_chat_events(session, message, run_limiter.deadline()), mimetype="text/event-stream",
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        response.call_on_close(run_limiter.release)  # held until the stream ends
+        return response
+
+    with session.lock:
+        session.history.append(session.llm.make_text_message("user", message))
+        session.persist()
+        try:
+            response = session.llm.chat(session.history, retain_tool_turns=True, deadline=run_limiter.deadline())
+            reply = reply_text(response)
+
+            return jsonify({
+                "success": True,
+                "session_id": session.id,
+                "message": message,
+                "reply": reply,
+                "model": session.llm.default_model
+            })
+        except RunTimeout as e:
+            return jsonify({"success": False, "error": str(e)}), 504
+        except Exception as e:
+            return jsonify({
+                "success": False,
+                "error": str(e),
+                "traceback": traceback.format_exc()
+            }), 500
+        finally:
+            session.persist()
+            session.touch()
+            run_limiter.release()
+
+def sse(event):
+    return f"data: {json.dumps(event)}\n\n"
+
+def threaded_sse(produce):
+    """Run `produce(emit, cancelled)` on its own thread and relay every event it emits as
+    SSE, sending a `: keep-alive` comment every `sse_heartbeat` seconds while it is quiet.
+    `cancelled` is set when the client goes away."""
+    events = queue.Queue()
+    cancelled = threading.Event()
+
+    def run():
+        try:
+            produce(lambda event: events.put(sse(event)), cancelled)
+        finally:
+            events.put(None)
+
+    threading.Thread(target=run, daemon=True).start()
     try:
-        response = llm.chat(history)
-        reply = response.get("choices", [{}])[0].get("message", {}).get("content", "")
-        history.append(llm.make_text_message("assistant", reply))
-        
-        return jsonify({
-            "success": True,
-            "message": message,
-            "reply": reply,
-            "model": llm.default_model
-        })
-    except Exception as e:
-        return jsonify({
-            "success": False,
-            "error": str(e),
-            "traceback": traceback.format_exc()
-        }), 500
+        while True:
+            try:
+                item = events.get(timeout=sse_heartbeat)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if item is None:
+                return
+            yield item
+    finally:
+        cancelled.set()
+
+def stream_chat_events(session, message, deadline=None):
+    """Server-sent events for a streamed chat: `start`, then `token` per content delta,
+    `tool_call`/`tool_result` as each tool starts and finishes, `tool_output` with live
+    shell output, `turn` stats and a final `done` (or `error`) event with the reply. If the
+    client goes away the run stops at the next event; past `deadline` it stops with an
+    `error` event before the next model request or tool batch."""
+    def produce(emit, cancelled):
+        try:
+            with session.lock:
+                session.history.append(session.llm.make_text_message("user", message))
+                session.persist()
+                session.output_listener = lambda command, stream, text: emit(
+                    {"type": "tool_output", "name": "shell_command", "command": command, "stream": stream,
+                     "text": text})
+                try:
+                    for event in session.llm.stream_chat(session.history, retain_tool_turns=True, deadline=deadline):
+                        if cancelled.is_set():
+                            break
+                        if event["type"] == "turn":
+                            session.persist()  # each finished round is in the history by now
+                        elif event["type"] == "done":
+                            reply = reply_text(event["response"])
+                            event = {"type": "done", "success": True, "session_id": session.id, "message": message,
+                                     "reply": reply, "model": session.llm.default_model}
+                        emit(event)
+                except Exception as e:
+                    emit({"type": "error", "success": False, "error": str(e), "traceback": traceback.format_exc()})
+                finally:
+                    session.output_listener = None
+                    session.persist()
+        finally:
+            sessions.release(session)
+
+    yield sse({"type": "start", "session_id": session.id, "model": session.llm.default_model})
+    sessions.hold(session)  # for the run, which may outlast the response; released when it ends
+    yield from threaded_sse(produce)
+
+@app.route('/api/sessions', methods=['GET'])
+def list_sessions():
+    return jsonify({"sessions": sessions.list(), "max_sessions": sessions.max_sessions})
+
+@app.route('/api/sessions', methods=['POST'])
+def create_session():
+    data = request.get_json(silent=True) or {}
+    session_id = data.get('session_id') or uuid.uuid4().hex
+    try:
+        session = current_session(session_id=session_id)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify({"success": True, **session.info()})
+
+@app.route('/api/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    if not sessions.delete(session_id):
+        return jsonify({"success": False, "error": "Unknown session"}), 404
+    return jsonify({"success": True, "message": f"Session {session_id} closed"})
 
 @app.route('/api/history', methods=['GET'])
 def get_history():
-    return jsonify({
-        "history": [
-            {"role": msg.role, "content": msg.content} 
-            for msg in history 
-            if msg.role != "system"  # Exclude system messages
-        ]
-    })
+    """The conversation without the system prompt; `offset` and `limit` select a page
+    (served from the conversation log's index when the session has one)."""
+    session = current_session(create=False)
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = request.args.get('limit')
+        stop = offset + max(int(limit), 0) if limit is not None else None
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+    log = session.log if session is not None else sessions.open_log(request_session_id(), create=False)
+    if log is not None and not log.closed:
+        total = len(log)
+        records = log.records(offset, stop)
+        if session is None:
+            log.close()  # an evicted session's log, read from disk
+    elif session is None:
+        return jsonify({"history": [], "total": 0, "offset": offset})
+    else:
+        messages = [m for m in session.history if m.role != "system"]  # Exclude system messages
+        total = len(messages)
+        records = [m.model_dump(exclude_none=True) for m in messages[offset:stop]]
+    return jsonify({"history": records, "total": total, "offset": offset})
 
 @app.route('/api/history/clear', methods=['POST'])
 def clear_history():
-    global history
-    history = [history[0]]  # Keep only the system message
+    session = current_session()
+    with session.lock:
+        session.clear_history()  # Keep only the system message
     return jsonify({"success": True, "message": "History cleared"})
 
 @app.route('/api/reset', methods=['POST'])
 def reset_memory():
-    global llm, history
-    
-    model = llm.default_model  # Keep the current model
-    initialize_llm(model)
-    
+    session = current_session()
+    with session.lock:
+        session.reset()  # Keeps the current model; archives the conversation log
+
     return jsonify({"success": True, "message": "Memory and LLM completely reset"})
 
 @app.route('/api/models', methods=['GET'])
 def get_models():
     try:
-        models = llm.list_models()
+        models = current_session().llm.list_models(refresh=request.args.get('refresh') in ('1', 'true'))
         return jsonify({"models": models})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/model', methods=['GET'])
 def get_current_model():
-    return jsonify({"model": llm.default_model})
+    return jsonify({"model": current_session().llm.default_model})
 
 @app.route('/api/model', methods=['POST'])
 def set_model():
     data = request.json
     if not data or 'model' not in data:
         return jsonify({"error": "Model ID is required"}), 400
-    
-    llm.default_model = data['model']
-    return jsonify({"success": True, "model": llm.default_model})
+
+    session = current_session()
+    session.llm.default_model = data['model']
+    return jsonify({"success": True, "model": session.llm.default_model})
 
 @app.route('/api/files', methods=['GET'])
 def get_file_list():
     directory = request.args.get('dir', '.')
     try:
-        files = list_files(directory)
+        files = current_session().tools["list_files"](directory)
         return jsonify({"success": True, "files": files})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 400
 
+@app.route('/api/tree', methods=['GET'])
+def get_tree():
+    directory = request.args.get('dir', '.')
+    try:
+        session = current_session()
+        listing = list_tree_entries(safe_path(directory, session.working_dir), directory,
+                                    int(request.args.get('depth', 3)), request.args.get('pattern'),
+                                    min(int(request.args.get('max_entries', DEFAULT_MAX_ENTRIES)), 100_000),
+                                    root=session.working_dir)
+        return jsonify({"success": True, **listing.model_dump()})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    query = request.args.get('q')
+    if not query:
+        return jsonify({"error": "Query (q) is required"}), 400
+
+    try:
+        result = get_index(current_session().working_dir).search(
+            query, regex=parse_flag(request.args.get('regex')), case_sensitive=parse_flag(request.args.get('case_sensitive')),
+            glob=request.args.get('glob'), max_results=min(int(request.args.get('max_results', 100)), 10_000))
+        return jsonify({"success": True, **result.model_dump()})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
 @app.route('/api/files', methods=['POST'])
 def create_file():
     data = request.json
     if not data or 'filepath' not in data or 'content' not in data:
         return jsonify({"error": "Filepath and content are required"}), 400
-    
+
     try:
-        result = write_file(data['filepath'], data['content'])
+        result = current_session().tools["write_file"](data['filepath'], data['content'])
         return jsonify({"success": True, "result": result})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 400
 
+@app.route('/api/files/batch', methods=['GET'])
+def read_files_route():
+    paths = request.args.getlist('filepath')
+    if not paths:
+        return jsonify({"error": "At least one filepath is required"}), 400
+
+    try:
+        max_bytes = min(int(request.args.get('max_bytes', DEFAULT_MAX_BYTES)), MAX_CONTENT_BYTES)
+        result = read_many(current_session().working_dir, parse_paths(paths), max_bytes=max_bytes)
+        return jsonify({"success": True, **result.model_dump()})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+@app.route('/api/files/batch', methods=['POST'])
+def write_files_route():
+    data = request.json
+    if not data or 'files' not in data:
+        return jsonify({"error": "Files are required"}), 400
+
+    try:
+        result = write_many(current_session().working_dir, parse_files(data['files']))
+        return jsonify({"success": True, **result.model_dump()})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+@app.route('/api/files/edit', methods=['POST'])
+def edit_file_route():
+    data = request.json
+    if not data or 'filepath' not in data or 'edit' not in data:
+        return jsonify({"error": "Filepath and edit are required"}), 400
+
+    try:
+        result = edit_file(current_session().working_dir, data['filepath'], data['edit'])
+        return jsonify({"success": True, "result": result.render(), **result.model_dump()})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
 @app.route('/api/files', methods=['DELETE'])
 def delete_file_route():
     data = request.json
     if not data or 'filepath' not in data:
         return jsonify({"error": "Filepath is required"}), 400
-    
+
     try:
-        result = delete_file(data['filepath'])
+        result = current_session().tools["delete_file"](data['filepath'])
         return jsonify({"success": True, "result": result})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 400
@@ -247,10 +723,13 @@ def get_file_content():
     filepath = request.args.get('filepath')
     if not filepath:
         return jsonify({"error": "Filepath is required"}), 400
-    
+
     try:
-        content = read_file(filepath)
-        return jsonify({"success": True, "content": content, "filepath": filepath})
+        max_bytes = min(int(request.args.get('max_bytes', DEFAULT_MAX_BYTES)), MAX_CONTENT_BYTES)
+        chunk = read_chunk(safe_path(filepath, current_session().working_dir), filepath,
+                           lines=request.args.get('lines'), byte_range=request.args.get('byte_range'),
+                           continuation=request.args.get('continuation'), max_bytes=max_bytes, cache=file_cache)
+        return jsonify({"success": True, "filepath": filepath, **chunk.model_dump(exclude={"path"})})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 400
 
@@ -259,9 +738,9 @@ def create_dir():
     data = request.json
     if not data or 'directory' not in data:
         return jsonify({"error": "Directory path is required"}), 400
-    
+
     try:
-        result = create_directory(data['directory'])
+        result = current_session().tools["create_directory"](data['directory'])
         return jsonify({"success": True, "result": result})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 400
@@ -271,30 +750,69 @@ def delete_dir():
     data = request.json
     if not data or 'directory' not in data:
         return jsonify({"error": "Directory path is required"}), 400
-    
+
     try:
-        result = remove_directory(data['directory'])
+        result = current_session().tools["remove_directory"](data['directory'])
         return jsonify({"success": True, "result": result})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 400
 
 @app.route('/api/shell', methods=['POST'])
-def run_shell():
+def shell():
     data = request.json
     if not data or 'command' not in data:
         return jsonify({"error": "Command is required"}), 400
-    
+
+    try:
+        session = current_session()
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    command, timeout = data['command'], parse_timeout(data.get('timeout'))
+    cpu_limit = parse_cpu_limit(data.get('cpu_limit'), shell_cpu_limit)  # may lower the server's limit, not raise it
+
+    if data.get('stream'):
+        # `output` events as the command writes, then `done` with the capped result
+        def produce(emit, cancelled):
+            try:
+                result = run_shell(command, cwd=session.working_dir, timeout=timeout, cpu_limit=cpu_limit,
+                                   cancel=cancelled,
+                                   on_output=lambda stream, text: emit({"type": "output", "stream": stream, "text": text}))
+                get_index(session.working_dir).mark_stale()
+                emit({"type": "done", "success": True, "result": result})
+            except Exception as e:
+                emit({"type": "error", "success": False, "error": str(e)})
+        return Response(threaded_sse(produce), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
     try:
-        result = shell_command(data['command'])
+        result = run_shell(command, cwd=session.working_dir, timeout=timeout, cpu_limit=cpu_limit)
+        get_index(session.working_dir).mark_stale()
         return jsonify({"success": True, "result": result})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 400
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.to_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/api/cache', methods=['GET'])
+def get_cache_stats():
+    return jsonify({"file_cache": file_cache.stats()})
+
+@app.route('/api/cache', methods=['DELETE'])
+def clear_cache():
+    file_cache.clear()
+    return jsonify({"success": True, "message": "File cache cleared"})
+
 @app.route('/api/info', methods=['GET'])
 def get_info():
+    session = current_session()
     return jsonify({
-        "working_directory": working_dir,
-        "model": llm.default_model,
+        "working_directory": session.working_dir,
+        "model": session.llm.default_model,
+        "session_id": session.id,
+        "sessions": len(sessions.list()),
+        "routing": router.stats() if router is not None else None,
         "version": "0.1.0"
     })
 
@@ -305,27 +823,51 @@ def main():
     parser.add_argument("--dir", "-d", help="Working directory (default: current directory)", default=os.getcwd())
     parser.add_argument("--port", "-p", help="Port to run the server on", type=int, default=5000)
     parser.add_argument("--host", help="Host to run the server on", default="0.0.0.0")
-    parser.add_argument("--model", "-m", help="Default model to use", default="openrouter/optimus-alpha")
+    parser.add_argument("--max-sessions", help="Maximum concurrent sessions", type=int, default=64)
+    parser.add_argument("--session-idle-timeout", help="Seconds before an idle session is evicted", type=int, default=3600)
+    parser.add_argument("--file-cache-mb", help="Byte budget of the shared file content cache", type=int, default=64)
+    parser.add_argument("--rpm", help="Client-side limit on model requests per minute, shared by all sessions (0: none)",
+                        type=int, default=0)
+    parser.add_argument("--tpm", help="Client-side limit on model tokens per minute, shared by all sessions (0: none)",
+                        type=int, default=0)
+    parser.add_argument("--history-dir", help="Where conversation logs are kept (sessions resume from them)",
+                        default=data_dir())
+    parser.add_argument("--no-history", help="Keep conversations in memory only", action="store_true")
+    parser.add_argument("--shell-cpu-limit", help="CPU seconds each shell command may use (0: no limit)",
+                        type=int, default=0)
+    parser.add_argument("--sse-heartbeat", help="Seconds between keep-alive comments on event streams", type=float, default=15)
+    add_routing_arguments(parser, "openrouter/optimus-alpha")
+    add_serving_arguments(parser)
     args = parser.parse_args()
-    
+
     # Set working directory
-    global working_dir
-    working_dir = os.path.abspath(args.dir)
-    if not os.path.isdir(working_dir):
-        print(f"Error: {working_dir} is not a valid directory")
+    root = os.path.abspath(args.dir)
+    if not os.path.isdir(root):
+        print(f"Error: {root} is not a valid directory")
         return
-    
-    # Initialize LLM
-    initialize_llm(args.model)
-    
+
+    # Initialize session store
+    global router, fast_model, sse_heartbeat, file_cache, shell_cpu_limit
+    model, router = router_from_args(args)
+    fast_model = args.fast_model
+    configure(root, model, args.max_sessions, args.session_idle_timeout,
+              history_dir=None if args.no_history else args.history_dir)
+    configure_limiter(run_limiter, args)
+    rate_limiter.configure(args.rpm, args.tpm)
+    sse_heartbeat = args.sse_heartbeat
+    shell_cpu_limit = args.shell_cpu_limit or None
+    file_cache = FileCache(max_bytes=args.file_cache_mb * 1024 * 1024, metrics=metrics)
+    threading.Thread(target=get_index(root).refresh, daemon=True).start()  # warm the search index
+
     # Display startup message
     print(f"Nomina API Server")
     print(f"Working directory: {working_dir}")
-    print(f"Default model: {llm.default_model}")
+    print(f"Default model: {default_model}" + (f" (pool: {args.model})" if router is not None else ""))
+    print(f"Max sessions: {args.max_sessions} (idle timeout {args.session_idle_timeout}s)")
+    print(f"Conversation logs: {'off' if args.no_history else args.history_dir}")
     print(f"Starting server on http://{args.host}:{args.port}")
-    
-    # Start the Flask server
-    app.run(debug=True, host=args.host, port=args.port)
+
+    serve(app, args.host, args.port, args, run_limiter)
 
 if __name__ == '__main__':
     main()
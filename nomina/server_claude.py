@@ -8,6 +8,7 @@ import subprocess
 import traceback
 import argparse
 import re
+from nomina.serving import RunLimiter, add_serving_arguments, configure_limiter, serve
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -15,6 +16,7 @@ CORS(app)  # Enable CORS for all routes
 # Initialize global variables - will be set in main()
 working_dir = None
 history = []
+run_limiter = RunLimiter()  # caps concurrent claude runs; configured from the serving arguments
 
 # Simple message structure to replace LLM dependency
 def make_text_message(role, content):
@@ -33,6 +35,9 @@ def chat():
     if not data or 'message' not in data:
         return jsonify({"error": "Message is required"}), 400
     
+    if not run_limiter.acquire():
+        return jsonify({"success": False, "error": "Server busy, retry later"}), 503, {"Retry-After": "5"}
+
     message = data['message']
     history.append(make_text_message("user", message))
     
@@ -59,7 +64,7 @@ def chat():
             capture_output=True,
             text=True,
             cwd=working_dir,
-            timeout=600,
+            timeout=run_limiter.run_timeout,
             env=env
         )
         
@@ -86,6 +91,8 @@ def chat():
             "error": str(e),
             "traceback": traceback.format_exc()
         }), 500
+    finally:
+        run_limiter.release()
 
 @app.route('/api/history', methods=['GET'])
 def get_history():
@@ -110,6 +117,7 @@ def main():
     parser.add_argument("--dir", "-d", help="Working directory (default: current directory)", default=os.getcwd())
     parser.add_argument("--port", "-p", help="Port to run the server on", type=int, default=5000)
     parser.add_argument("--host", help="Host to run the server on", default="0.0.0.0")
+    add_serving_arguments(parser)
     args = parser.parse_args()
     
     # Set working directory
@@ -124,8 +132,8 @@ def main():
     print(f"Working directory: {working_dir}")
     print(f"Starting server on http://{args.host}:{args.port}")
     
-    # Start the Flask server
-    app.run(debug=True, host=args.host, port=args.port)
+    configure_limiter(run_limiter, args)
+    serve(app, args.host, args.port, args, run_limiter)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,155 @@
+"""
+Production serving for the Nomina API servers: a threaded (waitress) or multi-worker
+(gunicorn) WSGI server with connection and agent-run timeouts, backpressure and graceful
+shutdown.
+The Flask development server is still available with --dev.
+"""
+import _thread
+import signal
+import sys
+import threading
+import time
+
+
+class RunLimiter:
+    """Caps concurrent long-running agent runs so short requests (/api/files,
+    /api/info, ...) always find a free server thread, and tracks in-flight runs so a
+    shutdown can let them finish. `run_timeout` bounds how long one run may take."""
+    def __init__(self, max_runs=0, queue_timeout=0.0, run_timeout=None):
+        self.max_runs = max_runs
+        self.queue_timeout = queue_timeout
+        self.run_timeout = run_timeout
+        self.draining = False
+        self._active = 0
+        self._cond = threading.Condition()
+
+    @property
+    def active(self):
+        return self._active
+
+    def acquire(self):
+        """Reserve a run slot, waiting up to `queue_timeout`; False when saturated or draining."""
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            while not self.draining and self.max_runs and self._active >= self.max_runs:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            if self.draining:
+                return False
+            self._active += 1
+            return True
+
+    def deadline(self):
+        """time.monotonic() by which a run starting now must end, or None."""
+        return time.monotonic() + self.run_timeout if self.run_timeout else None
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def drain(self, timeout):
+        """Refuse new runs and wait up to `timeout` seconds for in-flight ones."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self.draining = True
+            self._cond.notify_all()
+            while self._active:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        return self._active == 0
+
+
+def add_serving_arguments(parser):
+    group = parser.add_argument_group("serving")
+    group.add_argument("--dev", action="store_true", help="Use the Flask development server (debugger + reloader)")
+    group.add_argument("--workers", "-w", type=int, default=1,
+                       help="Worker processes; >1 uses gunicorn (sessions are per process, use sticky routing)")
+    group.add_argument("--threads", "-t", type=int, default=16, help="Request threads per worker")
+    group.add_argument("--timeout", type=int, default=120,
+                       help="Seconds an idle client connection is kept open before it is closed (agent runs "
+                            "are bounded by --run-timeout)")
+    group.add_argument("--graceful-timeout", type=int, default=60,
+                       help="Seconds to let in-flight agent runs finish on SIGTERM/SIGINT")
+    group.add_argument("--backlog", type=int, default=1024, help="Listen socket backlog")
+    group.add_argument("--connection-limit", type=int, default=200, help="Maximum simultaneous client connections")
+    group.add_argument("--max-agent-runs", type=int, default=0,
+                       help="Concurrent agent runs per worker before answering 503 (default: threads - 2)")
+    group.add_argument("--queue-timeout", type=float, default=5.0,
+                       help="Seconds a new agent run waits for a free slot before 503")
+    group.add_argument("--run-timeout", type=float, default=900,
+                       help="Seconds an agent run may take before it is stopped (0: no limit)")
+    return group
+
+
+def configure_limiter(limiter, args):
+    limiter.max_runs = args.max_agent_runs or max(1, args.threads - 2)
+    limiter.queue_timeout = args.queue_timeout
+    limiter.run_timeout = args.run_timeout or None
+
+
+def _install_graceful_shutdown(limiter, timeout):
+    def drain_then_stop():
+        limiter.drain(timeout)
+        _thread.interrupt_main()  # KeyboardInterrupt ends the server loop
+
+    def handler(signum, frame):
+        if limiter.draining:
+            raise KeyboardInterrupt  # second signal: stop now
+        print(f"Shutting down, waiting up to {timeout}s for {limiter.active} agent run(s)...", file=sys.stderr)
+        threading.Thread(target=drain_then_stop, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+
+
+def _serve_gunicorn(app, host, port, args):
+    from gunicorn.app.base import BaseApplication
+
+    class NominaApplication(BaseApplication):
+        def load_config(self):
+            options = {"bind": f"{host}:{port}", "workers": args.workers, "threads": args.threads,
+                       "worker_class": "gthread", "keepalive": 5, "timeout": max(args.timeout, 30),
+                       "graceful_timeout": args.graceful_timeout, "backlog": args.backlog,
+                       "worker_connections": args.connection_limit}
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    NominaApplication().run()
+
+
+def serve(app, host, port, args, limiter=None):
+    """Run `app` according to the parsed serving arguments."""
+    if args.dev:
+        app.run(debug=True, host=host, port=port)
+        return
+
+    if args.workers > 1:
+        try:
+            return _serve_gunicorn(app, host, port, args)
+        except ImportError:
+            print("gunicorn is not installed (pip install nomina[serve]); falling back to one worker", file=sys.stderr)
+
+    if limiter is not None:
+        _install_graceful_shutdown(limiter, args.graceful_timeout)
+    try:
+        from waitress import create_server
+    except ImportError:
+        print("waitress is not installed (pip install nomina[serve]); using the threaded werkzeug server",
+              file=sys.stderr)
+        from werkzeug.serving import make_server
+        server = make_server(host, port, app, threaded=True)
+        server.serve_forever()
+        return
+
+    server = create_server(app, host=host, port=port, threads=args.threads, backlog=args.backlog,
+                           connection_limit=args.connection_limit, channel_timeout=args.timeout,
+                           ident="nomina")
+    server.run()
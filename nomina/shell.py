@@ -0,0 +1,159 @@
+"""
+Bounded shell execution for the shell_command tools: wall-clock and CPU time limits,
+process-group kill, capped output that keeps the head and the tail, and incremental
+output callbacks for live display.
+"""
+import codecs
+import os
+import signal
+import subprocess
+import threading
+import time
+from typing import Callable, Optional
+
+DEFAULT_TIMEOUT = 120.0
+MAX_TIMEOUT = 1800.0
+DEFAULT_MAX_OUTPUT = 30_000  # characters kept per stream
+KILL_GRACE = 2.0  # seconds between SIGTERM and SIGKILL
+PIPE_DRAIN = 1.0  # seconds to keep reading after exit (background children may hold the pipes)
+
+
+class CappedOutput:
+    """Keeps the first and last characters of a stream within `limit`, counting what is dropped."""
+    def __init__(self, limit: int, head_ratio: float = 0.3):
+        self.head_limit = int(limit * head_ratio)
+        self.tail_limit = limit - self.head_limit
+        self.head = ""
+        self.tail = ""
+        self.dropped = 0
+
+    def write(self, text: str):
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += text[:room]
+            text = text[room:]
+        if not text:
+            return
+        self.tail += text
+        if len(self.tail) > 2 * self.tail_limit:  # trim in amortised steps
+            excess = len(self.tail) - self.tail_limit
+            self.dropped += excess
+            self.tail = self.tail[excess:]
+
+    def getvalue(self) -> str:
+        excess = max(0, len(self.tail) - self.tail_limit)
+        dropped, tail = self.dropped + excess, self.tail[excess:]
+        if not dropped:
+            return self.head + tail
+        return f"{self.head}\n[... {dropped} characters omitted ...]\n{tail}"
+
+
+def _kill_group(proc: subprocess.Popen, sig):
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, sig)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_shell(command: str, cwd: Optional[str] = None, timeout: float = DEFAULT_TIMEOUT,
+              cpu_limit: Optional[int] = None, max_output: int = DEFAULT_MAX_OUTPUT,
+              on_output: Optional[Callable[[str, str], None]] = None, output_interval: float = 0.1,
+              cancel: Optional[threading.Event] = None, env: Optional[dict] = None) -> dict:
+    """Run `command` in a shell in its own process group. On timeout (or `cancel`) the
+    whole group gets SIGTERM, then SIGKILL after KILL_GRACE. `cpu_limit` caps CPU seconds
+    via `ulimit -t`. Each stream keeps at most `max_output` characters (head and tail).
+    `on_output(stream, text)` is called from the calling thread with output coalesced over
+    `output_interval` seconds. Returns stdout, stderr, returncode, timed_out and seconds."""
+    if cpu_limit and os.name == "posix":
+        command = f"ulimit -t {int(cpu_limit)}; {command}"
+    start = time.monotonic()
+    proc = subprocess.Popen(command, shell=True, cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+    buffers = {"stdout": CappedOutput(max_output), "stderr": CappedOutput(max_output)}
+    pending, lock = [], threading.Lock()
+
+    def reader(name, pipe):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        for chunk in iter(lambda: pipe.read1(65536), b""):
+            text = decoder.decode(chunk)
+            with lock:
+                buffers[name].write(text)
+                if on_output is not None:
+                    pending.append((name, text))
+        pipe.close()
+
+    readers = [threading.Thread(target=reader, args=(name, pipe), daemon=True)
+               for name, pipe in (("stdout", proc.stdout), ("stderr", proc.stderr))]
+    for t in readers:
+        t.start()
+
+    def flush():
+        if on_output is None:
+            return
+        with lock:
+            chunks = pending[:]
+            pending.clear()
+        for name, text in chunks:
+            on_output(name, text)
+
+    timed_out = cancelled = False
+    deadline = start + timeout
+    while True:
+        try:
+            proc.wait(timeout=output_interval)
+            break
+        except subprocess.TimeoutExpired:
+            flush()
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+            elif time.monotonic() < deadline:
+                continue
+            else:
+                timed_out = True
+            _kill_group(proc, signal.SIGTERM)
+            try:
+                proc.wait(timeout=KILL_GRACE)
+            except subprocess.TimeoutExpired:
+                _kill_group(proc, signal.SIGKILL)
+                proc.wait()
+            break
+
+    drain_until = time.monotonic() + PIPE_DRAIN
+    for t in readers:
+        t.join(max(0.0, drain_until - time.monotonic()))
+    if any(t.is_alive() for t in readers):
+        _kill_group(proc, signal.SIGKILL)  # orphaned background jobs still writing
+    flush()
+
+    result = {"stdout": buffers["stdout"].getvalue(), "stderr": buffers["stderr"].getvalue(),
+              "returncode": proc.returncode, "timed_out": timed_out,
+              "seconds": round(time.monotonic() - start, 3)}
+    if timed_out:
+        result["stderr"] += f"\n[killed after {timeout:g}s timeout]"
+    elif cancelled:
+        result["stderr"] += "\n[cancelled]"
+    return result
+
+
+def parse_timeout(value, default: float = DEFAULT_TIMEOUT, maximum: float = MAX_TIMEOUT) -> float:
+    """Timeout argument from a tool call (tool arguments arrive as strings)."""
+    try:
+        timeout = float(value) if value not in (None, "") else default
+    except (TypeError, ValueError):
+        timeout = default
+    return min(max(timeout, 1.0), maximum)
+
+
+def parse_cpu_limit(value, maximum: Optional[int] = None) -> Optional[int]:
+    """CPU seconds for `run_shell` from a request: a positive integer, no more than
+    `maximum` (the operator's limit, which a request may only lower); else `maximum`."""
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return maximum
+    if limit <= 0:
+        return maximum
+    return min(limit, maximum) if maximum else limit
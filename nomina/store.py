@@ -0,0 +1,173 @@
+"""
+Durable conversation logs, so a crash or restart doesn't lose a session.
+
+A conversation is two files: `<name>.jsonl`, one compact JSON record per Message
+(tool calls and results included), only ever appended to, and `<name>.idx`, the byte
+offset of every record as a little-endian uint64. The index gives the message count from
+the file size and any page of messages with two seeks, so resuming (from the last few
+hundred messages) or paging a long session never re-parses the whole transcript.
+Clearing a conversation archives both files under a timestamped name and starts a new
+pair.
+"""
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .nominallm import Message
+
+_OFFSET = struct.Struct("<Q")
+RESUME_MESSAGES = 200  # messages a resumed session starts with; older ones stay on disk
+
+
+def data_dir() -> str:
+    base = os.getenv("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, "nomina", "history")
+
+
+def log_name(session_id: str) -> str:
+    """File name for a session id: the id itself when it is filename-safe, else a safe
+    prefix plus a hash so distinct ids never share a log."""
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", session_id)[:80].lstrip(".") or "_"
+    if safe == session_id:
+        return safe
+    return f"{safe}-{hashlib.sha1(session_id.encode()).hexdigest()[:10]}"
+
+
+def root_dir(base: str, root: str) -> str:
+    """Directory holding the logs of sessions on working directory `root`."""
+    root = os.path.realpath(root)
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", os.path.basename(root) or "root")
+    return os.path.join(base, f"{name}-{hashlib.sha1(root.encode()).hexdigest()[:12]}")
+
+
+class ConversationLog:
+    """Append-only message log with an offset index. Thread-safe."""
+    def __init__(self, directory: str, name: str):
+        os.makedirs(directory, exist_ok=True)
+        self.log_path = os.path.join(directory, name + ".jsonl")
+        self.index_path = os.path.join(directory, name + ".idx")
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        self._log = open(self.log_path, "a+b")
+        self._index = open(self.index_path, "a+b")
+        self._repair()
+
+    def _repair(self):
+        """Make the index cover exactly the complete records in the log. Records are
+        written before their index entry, so after a crash the log may hold records the
+        index lacks (added here) or a torn last line (cut off)."""
+        count = os.fstat(self._index.fileno()).st_size // _OFFSET.size
+        log_size = os.fstat(self._log.fileno()).st_size
+        while count and self._offset(count - 1) >= log_size:
+            count -= 1
+        keep = max(count - 1, 0)  # re-derive the last entry along with any missing ones
+        pos = self._offset(keep) if count else 0
+        self._log.seek(pos)
+        starts = []
+        for line in iter(self._log.readline, b""):
+            if not line.endswith(b"\n"):
+                self._log.truncate(pos)
+                break
+            starts.append(pos)
+            pos += len(line)
+        self._index.truncate(keep * _OFFSET.size)
+        if starts:
+            self._index.write(b"".join(_OFFSET.pack(o) for o in starts))
+        self._index.flush()
+
+    def _offset(self, i: int) -> int:
+        self._index.seek(i * _OFFSET.size)
+        return _OFFSET.unpack(self._index.read(_OFFSET.size))[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return os.fstat(self._index.fileno()).st_size // _OFFSET.size
+
+    def append(self, messages: List[Message], sync: bool = False):
+        """Append messages; with `sync` the data is fsynced before returning."""
+        if not messages:
+            return
+        lines = [json.dumps(m.model_dump(exclude_none=True), separators=(",", ":"), ensure_ascii=False).encode() + b"\n"
+                 for m in messages]
+        with self._lock:
+            self._log.seek(0, os.SEEK_END)
+            pos = self._log.tell()
+            offsets = []
+            for line in lines:
+                offsets.append(pos)
+                pos += len(line)
+            self._log.write(b"".join(lines))
+            self._log.flush()
+            if sync:
+                os.fsync(self._log.fileno())
+            self._index.seek(0, os.SEEK_END)
+            self._index.write(b"".join(_OFFSET.pack(o) for o in offsets))
+            self._index.flush()
+
+    def records(self, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Raw records [start, stop), located through the index."""
+        with self._lock:
+            count = os.fstat(self._index.fileno()).st_size // _OFFSET.size
+            stop = count if stop is None else min(stop, count)
+            if start >= stop:
+                return []
+            begin = self._offset(start)
+            end = self._offset(stop) if stop < count else os.fstat(self._log.fileno()).st_size
+            self._log.seek(begin)
+            data = self._log.read(end - begin)
+        return [json.loads(line) for line in data.splitlines()]
+
+    def messages(self, start: int = 0, stop: Optional[int] = None) -> List[Message]:
+        return [Message.model_validate(r) for r in self.records(start, stop)]
+
+    def tail(self, limit: int = RESUME_MESSAGES) -> Tuple[int, List[Message]]:
+        """Up to the last `limit` messages, as (index of the first, messages). The window
+        opens at its first user message so it never starts inside a tool round; it reaches
+        further back only when the last `limit` messages hold none."""
+        start = max(len(self) - limit, 0)
+        records = self.records(start)
+        while start:
+            first = next((i for i, r in enumerate(records) if r.get("role") == "user"), None)
+            if first is not None:
+                start, records = start + first, records[first:]
+                break
+            earlier = max(start - limit, 0)
+            start, records = earlier, self.records(earlier, start) + records
+        return start, [Message.model_validate(r) for r in records]
+
+    def update(self, history: List[Message], offset: int = 1, skipped: int = 0):
+        """Append the messages of `history[offset:]` that are not logged yet (histories only
+        grow; see `archive` for clearing). `skipped`: logged messages that `history` leaves
+        out at the front, as after resuming from `tail`."""
+        logged = len(self)
+        self.append(history[offset + logged - skipped:])
+
+    def archive(self):
+        """Move the current log aside (as `<name>.<timestamp>.*`) and start an empty one."""
+        with self._lock:
+            self._log.close()
+            self._index.close()
+            if os.path.getsize(self.log_path):
+                stem = os.path.splitext(self.log_path)[0]
+                stamp, n = time.strftime("%Y%m%d-%H%M%S"), 1
+                while os.path.exists(f"{stem}.{stamp}.jsonl"):
+                    stamp, n = f"{time.strftime('%Y%m%d-%H%M%S')}-{n}", n + 1
+                for path in (self.log_path, self.index_path):
+                    os.replace(path, f"{stem}.{stamp}{os.path.splitext(path)[1]}")
+            self._open()
+
+    @property
+    def closed(self) -> bool:
+        return self._log.closed
+
+    def close(self):
+        with self._lock:
+            self._log.close()
+            self._index.close()
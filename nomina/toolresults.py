@@ -0,0 +1,147 @@
+"""
+Post-processing of tool results before they enter the conversation.
+
+Every result goes through its tool's `ResultPolicy`:
+- structured results are rendered compactly (a `shell_command` dict becomes a status line
+  plus its non-empty streams, with ANSI codes stripped and runs of repeated lines folded);
+- the text is capped at `max_chars`, keeping its head and tail;
+- a result identical to one already in the conversation is replaced by a pointer to it
+  (and gets its text back if compaction later cuts or drops the result pointed at).
+
+A result is processed once, when it is produced, so what the model sees of it stays
+byte-stable on every later round.
+"""
+import hashlib
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from .compaction import elide
+
+_ANSI = re.compile(r"\x1b\[[0-?]*[ -/]*[@-~]|\x1b[@-Z\\-_]")
+_POINTER = re.compile(r"\[Identical to the result of tool call (.+) above \(\d+ characters\)\]")
+
+
+class ResultPolicy(BaseModel):
+    max_chars: Optional[int] = 120_000  # None: the tool bounds its own output
+    head_ratio: float = 0.7  # share of `max_chars` kept from the start
+    dedup: bool = True
+    min_dedup_chars: int = 500  # shorter results are cheaper to repeat than to point at
+    formatter: Optional[Callable[[Any], str]] = Field(default=None, exclude=True)  # replaces the default rendering
+
+
+SHELL_POLICY = ResultPolicy(max_chars=16_000, head_ratio=0.3)  # errors and summaries come at the end
+
+
+def fold_repeats(text: str, min_run: int = 3) -> str:
+    """Replace runs of `min_run` or more identical lines with one line and a count."""
+    lines = text.split("\n")
+    out, i = [], 0
+    while i < len(lines):
+        j = i + 1
+        while j < len(lines) and lines[j] == lines[i]:
+            j += 1
+        if j - i >= min_run:
+            out += [lines[i], f"[previous line repeated {j - i - 1} more times]"]
+        else:
+            out += lines[i:j]
+        i = j
+    return "\n".join(out)
+
+
+def is_shell_result(result) -> bool:
+    return isinstance(result, dict) and "returncode" in result and "stdout" in result
+
+
+def format_shell_result(result: dict, max_chars: Optional[int] = None, head_ratio: float = 0.3) -> str:
+    """`exit N after Xs` and the non-empty streams, sharing `max_chars` between them (a
+    short stream keeps all of its text; the other gets the rest)."""
+    status = f"exit {result.get('returncode')}"
+    if result.get("timed_out"):
+        status += " (timed out)"
+    if result.get("seconds") is not None:
+        status += f" after {result['seconds']}s"
+    streams = [(name, fold_repeats(_ANSI.sub("", result.get(name) or "")))
+               for name in ("stdout", "stderr")]
+    streams = [(name, text) for name, text in streams if text.strip()]
+    budget = max(max_chars - len(status) - 10 * len(streams), 200) if max_chars else None
+    if budget and sum(len(text) for _, text in streams) > budget:
+        short = min(len(text) for _, text in streams) if len(streams) > 1 else 0
+        short = min(short, budget // 2)
+        streams = [(name, text if len(text) <= short else elide(text, budget - short, head_ratio))
+                   for name, text in streams]
+    return "\n".join([status] + [f"[{name}]\n{text}" for name, text in streams])
+
+
+def render_result(result, policy: ResultPolicy) -> str:
+    if policy.formatter is not None:
+        text = policy.formatter(result)
+    elif is_shell_result(result):
+        return format_shell_result(result, policy.max_chars, policy.head_ratio)
+    elif isinstance(result, (dict, list)):
+        text = json.dumps(result, ensure_ascii=False, default=str)
+    else:
+        text = str(result)
+    return elide(text, policy.max_chars, policy.head_ratio) if policy.max_chars else text
+
+
+def _tool_fields(msg):
+    if isinstance(msg, dict):
+        return msg.get("role"), msg.get("content"), msg.get("tool_call_id")
+    return msg.role, msg.content, msg.tool_call_id
+
+
+def restore_pointers(before: list, after: list) -> List:
+    """`after` (a compaction of `before`) with dedup pointers fixed up where the compaction
+    cut or dropped the result they point at: the first such pointer gets the result's text
+    from `before` back, and later ones point at it instead."""
+    texts = {}
+    for msg in before:
+        role, content, call_id = _tool_fields(msg)
+        if role == "tool" and isinstance(content, str):
+            texts[call_id] = content
+    kept = {call_id: content for role, content, call_id in map(_tool_fields, after) if role == "tool"}
+    moved: Dict[str, str] = {}  # cut result -> the pointer that now holds its text
+    out = []
+    for msg in after:
+        role, content, call_id = _tool_fields(msg)
+        match = _POINTER.fullmatch(content) if role == "tool" and isinstance(content, str) else None
+        target = match and match.group(1)
+        if target in texts and kept.get(target) != texts[target]:
+            if target in moved:
+                content = content.replace(f"tool call {target} above", f"tool call {moved[target]} above", 1)
+            else:
+                moved[target], content = call_id, texts[target]
+            msg = msg.model_copy(update={"content": content})
+        out.append(msg)
+    return out
+
+
+class ResultDeduper:
+    """Remembers the tool results of one conversation by digest, starting with those
+    already in `messages`. Only results still present in full may be pointed at, so
+    rebuild it whenever messages are cut or dropped; with `max_chars`, longer results
+    (which would not be kept in full) are neither remembered nor replaced."""
+    def __init__(self, messages=(), min_chars: int = ResultPolicy().min_dedup_chars, max_chars: Optional[int] = None):
+        self.max_chars = max_chars
+        self.seen: Dict[str, str] = {}  # digest -> tool_call_id
+        for msg in messages:
+            role, content, call_id = _tool_fields(msg)
+            if role == "tool" and isinstance(content, str) and min_chars <= len(content) <= (max_chars or len(content)):
+                self.seen.setdefault(self._digest(content), call_id)
+
+    @staticmethod
+    def _digest(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+    def check(self, text: str, call_id: str, policy: ResultPolicy) -> str:
+        if not policy.dedup or len(text) < policy.min_dedup_chars or (self.max_chars and len(text) > self.max_chars):
+            return text
+        digest = self._digest(text)
+        earlier = self.seen.get(digest)
+        if earlier is not None and earlier != call_id:
+            return f"[Identical to the result of tool call {earlier} above ({len(text)} characters)]"
+        self.seen[digest] = call_id
+        return text